@@ -5,14 +5,11 @@
 # ---------------------------- #
 
 # Import built-in modules
-from typing import Self
+from typing import Self, Callable
+from sys import argv
+from time import perf_counter_ns
 import pygame as pg
 
-# Initialize Pygame environment
-pg.init()
-pg.display.init()
-pg.mixer.init()
-
 # Import Game Engines
 from libs import constants as cts
 from libs import Scene
@@ -20,6 +17,9 @@ from libs import Event
 from libs import Sound
 from libs import Map
 from libs import Transition
+from libs import Dirty
+from libs import Profiler
+from libs import Prefetch
 
 
 # Create Main GameEngine object
@@ -28,24 +28,77 @@ class GameEngine:
     Instance of the main game engine
     """
     def __init__(self: Self) -> None:
+        # Pygame is only initialized once the engine is created, importing the game has no side effect
+        self.start_time: int = perf_counter_ns()
+        pg.init()
+        pg.display.init()
+        pg.mixer.init()
+        
         self.screen: pg.Surface = pg.display.set_mode(cts.SCREEN.size, cts.SCREEN.flags)
-        self.clock: pg.time.Clock = pg.time.Clock()
+        self.clock: pg.time.Clock | Event.FixedClock = pg.time.Clock()
         self.scene: str = ""
-        self.scenes: dict[str, Scene.BaseScene] = {
-            "TitleScreen": Scene.TitleScreen(self),
-            "Options": Scene.Options(self),
-            "NewGame": Scene.NewGame(self),
-            "LoadGame": Scene.LoadGame(self),
-            "OverWorld":Scene.OverWorld(self)
+        self.dirty: Dirty.DirtyTracker = Dirty.DirtyTracker(cts.SCREEN.size)
+        self.profiler: Profiler.FrameProfiler = Profiler.FrameProfiler(["events", "update", "sound", "render", "display", "preload", "tick"])
+        # Scenes are built the first time they are shown, or preloaded once the first frame is displayed
+        self.factories: dict[str, Callable[[GameEngine], Scene.BaseScene]] = {
+            "TitleScreen": Scene.TitleScreen,
+            "Options": Scene.Options,
+            "NewGame": Scene.NewGame,
+            "LoadGame": Scene.LoadGame,
+            "OverWorld": Scene.OverWorld
         }
+        self.scenes: dict[str, Scene.BaseScene] = {}
+        self.preload: bool = cts.SCREEN.preload_scenes
+        self.preloading: bool = False
+        self.prefetcher: Prefetch.Prefetcher = Prefetch.Prefetcher()
+        self.startup_times: dict[str, float] = {}
         self.event_manager: Event.EventManager = Event.EventManager()
         self.sound_manager: Sound.SoundManager = Sound.SoundManager()
         self.alive: bool = True
+        self.transition: Transition.Transition | None = None
+        self.trace_path: str | None = None
+        self.startup_report: bool = False
+        self.startup_times["init"] = (perf_counter_ns() - self.start_time) / 1e6
+        
+    def get_scene(self: Self, name: str) -> Scene.BaseScene:
+        if name not in self.scenes:
+            start = perf_counter_ns()
+            self.scenes[name] = self.factories[name](self)
+            self.startup_times[f"scene.{name}"] = (perf_counter_ns() - start) / 1e6
+        return self.scenes[name]
+    
+    def preload_scene(self: Self) -> None:
+        # Maps of the scenes not built yet are read and decoded by the workers of the prefetcher
+        if not self.preloading:
+            self.preloading = True
+            self.prefetcher.prefetch([name for scene, factory in self.factories.items() if scene not in self.scenes for name in factory.maps], cancel=False)
+        
+        # Prefetched maps are converted on this thread one at a time, a scene is built once all of its maps are ready
+        self.prefetcher.poll()
+        name = next((name for name in self.factories if name not in self.scenes), None)
+        if name is None:
+            self.preload = False
+            return
+        if not self.prefetcher.is_pending(self.factories[name].maps):
+            self.get_scene(name)
+        
+    def get_startup_report(self: Self) -> str:
+        return "\n".join(f"{name:<24}{time:>10.2f} ms" for name, time in self.startup_times.items())
+        
+    def replay(self: Self, path: str) -> None:
+        # Replays run one fixed step per frame, so they give the same frames on every machine
+        self.clock = Event.FixedClock(1000 / cts.SCREEN.update_fps)
+        self.event_manager.start_replay(path, self.clock.get_ticks)
         
     def quit(self: Self) -> None:
         self.alive = False
         
-    def change_scene(self: Self, new_scene: str|None=None, reinit: bool=True, enter_transition: Transition.Transition|None=None) -> None:
+    def change_scene(self: Self, new_scene: str|None=None, reinit: bool=True, enter_transition: Transition.Transition|None=None, exit_transition: Transition.Transition|None=None) -> None:
+        # The scene only changes once the exit transition of the current one is over
+        if exit_transition:
+            self.play_transition(exit_transition, lambda: self.change_scene(new_scene, reinit, enter_transition))
+            return
+        
         # First we kill all timer events we created for previous scene
         self.event_manager.kill_timers()
         
@@ -54,45 +107,140 @@ class GameEngine:
             self.quit()
             return
         
-        # If there is a new scene, we initialize it
+        # If there is a new scene, we build it if needed and initialize it
+        self.get_scene(new_scene)
         self.scene = new_scene
         
         if reinit:
             self.scenes[new_scene].reinit()
             
         self.scenes[self.scene].update()
+        self.scenes[self.scene].interpolate(1)
             
         if enter_transition:
-            enter_transition.play(self.scenes[new_scene])
-            
-        pg.display.flip()
+            self.play_transition(enter_transition)
+        
+        # The new scene has to be rendered entirely
+        self.dirty.mark_all()
+        
+    def play_transition(self: Self, transition: Transition.Transition, on_done: Callable[[], None] | None=None) -> None:
+        # Transitions are advanced by the game loop, the scene is not updated until they end
+        transition.start(self.scenes[self.scene], on_done)
+        self.transition = transition
+        self.dirty.mark_all()
+        
+    def end_transition(self: Self) -> None:
+        transition, self.transition = self.transition, None
+        self.dirty.mark_all()
+        if transition is not None and transition.on_done is not None:
+            transition.on_done()
+
+    def step(self: Self) -> None:
+        # We handle the events of pygame
+        self.event_manager.handle_events()
+        if self.event_manager.get_event("Profiler"):
+            self.dirty.mark(self.profiler.toggle_overlay())
+        if self.event_manager.get_event("ProfilerTrace"):
+            print(f"Trace saved to {self.profiler.dump_trace()}")
+        if self.event_manager.get_event("MusicEnd"):
+            self.sound_manager.next_segment()
+        self.profiler.mark("events")
+        
+        # We update our current scene with changes, or the transition playing over it
+        if self.transition is None:
+            self.scenes[self.scene].update()
+        else:
+            if self.event_manager.get_event("Quit"):
+                self.quit()
+            self.transition.update(1000 / cts.SCREEN.update_fps)
+            if self.transition.done:
+                self.end_transition()
+        self.profiler.mark("update")
+        
+    def render(self: Self, alpha: float) -> None:
+        # The scene draws a state between its last two updates, it marks the regions it modified
+        if self.transition is None:
+            self.scenes[self.scene].interpolate(alpha)
+        elif self.transition.changed():
+            self.dirty.mark_all()
+        self.profiler.mark("render")
+        
+        # We render our scene and update screen only on modified rects, if any
+        if self.profiler.overlay:
+            self.dirty.mark(self.profiler.get_dirty_rect())
+        if self.dirty.is_dirty():
+            updated_rects = self.dirty.get_rects()
+            if self.transition is None:
+                self.scenes[self.scene].render(updated_rects)
+            else:
+                self.transition.draw(self.screen)
+            if self.profiler.overlay:
+                self.profiler.draw(self.screen)
+            self.profiler.mark("render")
+            pg.display.update(updated_rects)
+            self.dirty.clear()
+            if "first_frame" not in self.startup_times:
+                self.startup_times["first_frame"] = (perf_counter_ns() - self.start_time) / 1e6
+        self.profiler.mark("display")
 
     def run(self: Self) -> None:
+        step = 1000 / cts.SCREEN.update_fps
+        lag = step
+        skipped = 0
         while self.alive:
-            # We handle the events of pygame
-            self.event_manager.handle_events()
+            self.profiler.start_frame()
             
-            # We update our current scene with changes
-            updated_rects = self.scenes[self.scene].update()
+            # The game logic runs with a fixed step whatever the framerate, late frames run several steps
+            steps = 0
+            while lag >= step and steps < cts.SCREEN.max_steps and self.alive:
+                self.step()
+                lag -= step
+                steps += 1
             
             # We update our sound engine
             self.sound_manager.update()
+            self.profiler.mark("sound")
             
-            # We render our scene on the screen
-            self.scenes[self.scene].render()
+            # When the logic is still late we skip a few renders, then we give up on the time left to catch up
+            if lag >= step and skipped < cts.SCREEN.max_frame_skip:
+                skipped += 1
+            else:
+                skipped = 0
+                lag = min(lag, step)
+                self.render(lag / step)
             
-            # We update screen only on modified rects
-            pg.display.update(updated_rects)
+            # Scenes not built yet are preloaded when the frame is not late
+            if self.preload and "first_frame" in self.startup_times and lag < step:
+                self.preload_scene()
+            self.profiler.mark("preload")
             
-            # We tick our clock
-            self.clock.tick(cts.SCREEN.max_fps)
+            # We tick our clock, rendering can run at a lower rate than the logic
+            lag += self.clock.tick(cts.SCREEN.max_fps)
+            self.profiler.mark("tick")
+            self.profiler.end_frame()
         
         # If we exit our loop then the game has been exited
+        self.event_manager.save_recording()
+        if self.trace_path is not None:
+            self.profiler.dump_trace(self.trace_path)
+            print(self.profiler.get_stats()["frame"])
+        if self.startup_report:
+            print(self.get_startup_report())
         pg.quit()
         exit()
         
 # Launching the game
 if __name__ == "__main__":
+    # python Game.py [--record path | --replay path] [--trace path] [--startup] [--no-preload]
     game = GameEngine()
+    if "--record" in argv:
+        game.event_manager.start_recording(argv[argv.index("--record") + 1])
+    if "--replay" in argv:
+        game.replay(argv[argv.index("--replay") + 1])
+    if "--trace" in argv:
+        game.trace_path = argv[argv.index("--trace") + 1]
+    game.startup_report = "--startup" in argv
+    if "--no-preload" in argv:
+        game.preload = False
     game.change_scene(new_scene="OverWorld")
     game.run()
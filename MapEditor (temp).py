@@ -9,10 +9,11 @@ from tkinter.filedialog import askopenfilename, asksaveasfilename
 from os.path import basename
 import pygame as pg
 import tkinter as tk
-import json
 
 # import game components
-from libs.Map import Map, Tile, Tileset
+from libs.Map import Map, Tile, Tileset, animation_clock
+from libs.Camera import Camera
+from libs.Text import text_cache
 
 # Create constants
 WIDTH: int = 48*20
@@ -61,6 +62,7 @@ class MapEditor:
 
         # Initialize loop
         self.alive: bool = True
+        self.clock: pg.time.Clock = pg.time.Clock()
 
         # Render both displays
 
@@ -70,21 +72,23 @@ class MapEditor:
     # rendering methods
     def render_editor(self: Self) -> None:
         if self.current_map:
-            layers: Dict[int, pg.Surface] = self.current_map.render_layers((0, 0))
+            camera: Camera = Camera(self.current_map.get_pixel_size(), (WIDTH, HEIGHT))
+            camera.move_to(self.scroll_x, self.scroll_y)
+            layers: Dict[int, pg.Surface] = self.current_map.render_layers(camera)
 
             for layer_id, surface in layers.items():
+                if layer_id > self.current_layer:
+                    surface.set_alpha(128)
+                
+                self.screen.blit(surface, (0, 0))
+                surface.set_alpha(None)
+                
                 if layer_id < self.current_layer:
                     filtered_surface: pg.Surface = pg.Surface(surface.get_size(), pg.SRCALPHA)
                     filtered_surface.fill((0, 0, 0, 128))
-                    surface.blit(filtered_surface, (0, 0))
-                    
-                elif layer_id > self.current_layer:
-                    surface.set_alpha(128)
-                
-                self.screen.blit(surface, (-self.scroll_x, -self.scroll_y))
+                    self.screen.blit(filtered_surface, (0, 0))
 
-            font: pg.font.Font = pg.font.Font(None, 24)
-            text: pg.Surface = font.render(f"Current layer: {self.current_layer}", True, (255, 255, 255))
+            text: pg.Surface = text_cache.render(f"Current layer: {self.current_layer}", 24, (255, 255, 255))
             self.screen.blit(text, (10, 10))
 
     def render_tile_picker(self: Self) -> None:
@@ -102,7 +106,7 @@ class MapEditor:
 
             for i, tile in enumerate(self.current_map.tileset.tiles):
                 # create image
-                pg_surface = tile.get_tile([0]*8)
+                pg_surface = tile.get_tile(0).copy()
                 if self.current_tile and i == self.current_tile.tile_id:
                     surf = pg.Surface((tile_size, tile_size), pg.SRCALPHA)
                     surf.fill((0, 255, 0, 128))
@@ -137,9 +141,9 @@ class MapEditor:
             x, y = self.get_tile_pos(mouse_pos)
             if 0 <= x < self.current_map.size[0] and 0 <= y < self.current_map.size[1]:
                 if is_removal:
-                    self.current_map.tilemap[self.current_layer][y][x] = None
+                    self.current_map.set_tile(self.current_layer, x, y, None)
                 else:
-                    self.current_map.tilemap[self.current_layer][y][x] = self.current_tile
+                    self.current_map.set_tile(self.current_layer, x, y, self.current_tile)
 
     def handle_mouse_drag(self: Self) -> None:
         if self.mouse_held["placing"]:
@@ -170,35 +174,20 @@ class MapEditor:
             file_path = asksaveasfilename(defaultextension=".json", filetypes=[("Map Files", "*.json")])
         
             if file_path:
-                map_data = {
-                    "name": self.current_map.name,
-                    "size": self.current_map.size,
-                    "bgm": "",
-                    "bgs": "",
-                    "layer_id_range": self.current_map.layer_id_range,
-                    "tileset": self.current_map.tileset.name,
-                    "layers": []
-                }
-                
-                for layer_id, tiles in self.current_map.tilemap.items():
-                    layer_data = {
-                        "id": layer_id,
-                        "tiles": [[tile.tile_id if tile else -1 for tile in row] for row in tiles]
-                    }
-                    map_data["layers"].append(layer_data)
-
-                with open(file_path, 'w') as file:
-                    json.dump(map_data, file)
+                self.current_map.save_json(file_path)
 
     def load_map(self: Self) -> None:
         file_path = askopenfilename(defaultextension=".json", filetypes=[("Map Files", "*.json")])
     
         if file_path:
+            if self.current_map:
+                self.current_map.unload()
             self.current_map = Map(basename(file_path)[:-5])
 
     # Main loop
     def run(self: Self) -> None:
         while self.alive:
+            animation_clock.tick(self.clock.tick())
             self.screen.fill((255, 255, 255))
             self.render_editor()
             self.render_tile_picker()
@@ -230,8 +219,7 @@ class MapEditor:
                                 answer = askyesno("New Layer", f"Do you want to create a new layer above layer {self.current_layer} ?")
                                 if answer:
                                     self.current_layer += 1
-                                    self.current_map.layer_id_range[-1] += 1
-                                    self.current_map.tilemap[self.current_layer] = [[None for _ in range(self.current_map.size[0])] for _ in range(self.current_map.size[1])]
+                                    self.current_map.add_layer(self.current_layer)
 
                     elif event.key == pg.K_DOWN:
                         if self.current_map:
@@ -241,8 +229,7 @@ class MapEditor:
                                 answer = askyesno("New Layer", f"Do you want to create a new layer under layer {self.current_layer} ?")
                                 if answer:
                                     self.current_layer -= 1
-                                    self.current_map.layer_id_range[0] -= 1
-                                    self.current_map.tilemap[self.current_layer] = [[None for _ in range(self.current_map.size[0])] for _ in range(self.current_map.size[1])]
+                                    self.current_map.add_layer(self.current_layer)
 
                     elif event.key == pg.K_o:
                         self.load_map()
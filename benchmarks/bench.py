@@ -0,0 +1,176 @@
+#-*-coding:utf-8-*-
+
+# Benchmarks of the map and rendering hot paths, run from the root of the game:
+#   python -m benchmarks.bench [--quick] [--save] [name ...]
+# Results are written to benchmarks/results.json and compared to
+# benchmarks/baseline.json when it exists, --save stores them as the new baseline
+
+# Import built-in modules
+from typing import Any, Callable
+from os import environ, makedirs
+from os.path import join, exists, dirname
+from json import load, dump
+from time import perf_counter_ns
+from sys import argv, exit
+import numpy as np
+
+# No window nor sound device is needed
+environ["SDL_VIDEODRIVER"] = "dummy"
+environ["SDL_AUDIODRIVER"] = "dummy"
+
+# Import game components
+import Game
+from libs.constants import MAP as cts
+from libs.Camera import Camera
+from libs import Map, MapFile
+
+# Create constants of the benchmarks
+BENCHMARKS_FOLDER: str = dirname(__file__)
+RESULTS_PATH: str = join(BENCHMARKS_FOLDER, "results.json")
+BASELINE_PATH: str = join(BENCHMARKS_FOLDER, "baseline.json")
+# Synthetic maps are written in the cache folder, maps reach it relatively to the maps folder
+SYNTHETIC_FOLDER: str = join("Data", "Cache", "Benchmarks")
+SYNTHETIC_NAME: str = join("..", "Cache", "Benchmarks", "synthetic_{}x{}")
+SHIPPED_MAPS: list[str] = ["village", "tests"]
+SYNTHETIC_SIZES: list[tuple[int, int]] = [(20, 11), (100, 100), (1000, 1000)]
+QUICK_SIZES: list[tuple[int, int]] = [(20, 11), (100, 100)]
+# A benchmark regresses when its best time is this much slower than the baseline one, and slower by more than the noise
+TOLERANCE: float = 1.25
+NOISE: float = 0.05
+
+
+# Create helper functions of the benchmarks
+def measure(function: Callable[[], Any], repeat: int=5, number: int=1) -> dict[str, float]:
+    # Times are given in milliseconds for one call
+    times = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        for _ in range(number):
+            function()
+        times.append((perf_counter_ns() - start) / number / 1e6)
+    times.sort()
+    return {"median": times[len(times)//2], "min": times[0], "max": times[-1], "calls": repeat*number}
+
+
+def make_synthetic(width: int, height: int) -> str:
+    # Ground everywhere, blocky patches of field and wall tiles above it so every autotile variant shows up
+    name = SYNTHETIC_NAME.format(width, height)
+    path = join(cts.map_folder, f"{name}.json")
+    if exists(path):
+        return name
+    rng = np.random.default_rng(width*height)
+    tiles = np.full((3, height, width), -1, np.int16)
+    tiles[0] = 16
+    patches = rng.choice(np.array([-1, -1, 0, 17, 24, 25], np.int16), ((height-1)//4 + 1, (width-1)//4 + 1))
+    tiles[1] = patches.repeat(4, 0).repeat(4, 1)[:height, :width]
+    tiles[2] = np.where(rng.random((height, width)) < 0.05, 22, -1)
+    makedirs(SYNTHETIC_FOLDER, exist_ok=True)
+    MapFile.write_json(path, {"name": name, "size": [width, height], "bgm": "", "bgs": "", "layer_id_range": [-1, 2], "tileset": "Outside"}, tiles)
+    return name
+
+
+def bench_tile(results: dict[str, dict[str, float]]) -> None:
+    tileset = Map.get_tileset("Outside")
+    tile = tileset.tiles[0]
+    tile.get_tile(0)
+    results["tile.get_tile"] = measure(lambda: [tile.get_tile(mask) for mask in range(256)], number=20)
+    results["tileset.load_json"] = measure(lambda: Map.Tileset("Outside"), number=10)
+    Map.release_tileset("Outside")
+
+
+def bench_map(results: dict[str, dict[str, float]], name: str, label: str) -> None:
+    game_map = Map.Map(name)
+    width, height = game_map.size
+    rng = np.random.default_rng(0)
+    cells = list(zip(rng.integers(0, width, 1000).tolist(), rng.integers(0, height, 1000).tolist()))
+    results[f"{label}.get_neighborhood"] = measure(lambda: [game_map.get_neighborhood(0, x, y) for x, y in cells])
+
+    results[f"{label}.load_json"] = measure(game_map.load_json)
+
+    # A first render bakes every visible chunk, then the camera walks across the map
+    def render_cold() -> None:
+        game_map.chunks.clear()
+        game_map.chunks_frames.clear()
+        game_map.views.clear()
+        game_map.render_layers(Camera(game_map.get_pixel_size()))
+    results[f"{label}.render_layers.cold"] = measure(render_cold)
+
+    camera = Camera(game_map.get_pixel_size())
+    game_map.render_layers(camera)
+    def render_scroll() -> None:
+        camera.move(camera.speed, camera.speed//2)
+        Map.animation_clock.tick()
+        game_map.render_layers(camera)
+    results[f"{label}.render_layers.scroll"] = measure(render_scroll, number=60)
+    game_map.unload()
+
+
+def bench_overworld(results: dict[str, dict[str, float]], engine: Any, name: str, label: str) -> None:
+    scene = engine.get_scene("OverWorld")
+    scene.load_map(name)
+    event_manager = engine.event_manager
+
+    # Directions are held like keys would hold them, the camera goes right then left so it keeps moving even on large maps
+    def turn(release: str, press: str) -> None:
+        if event_manager.get_event(release):
+            event_manager.apply_input("release", release)
+        event_manager.apply_input("press", press)
+
+    def update() -> None:
+        if scene.camera.rect.right >= scene.camera.bounds[0] and not event_manager.get_event("MoveLeft"):
+            turn("MoveRight", "MoveLeft")
+        elif scene.camera.rect.left <= 0 and not event_manager.get_event("MoveRight"):
+            turn("MoveLeft", "MoveRight")
+        scene.update()
+        scene.interpolate(1)
+        engine.dirty.clear()
+    update()
+    results[f"{label}.overworld.update"] = measure(update, number=60)
+    for direction in ("MoveRight", "MoveLeft"):
+        if event_manager.get_event(direction):
+            event_manager.apply_input("release", direction)
+
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]]) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<48} {result['min']:>10.3f} ms")
+            continue
+        # Best times are the least disturbed by the rest of the machine
+        ratio = result["min"] / max(baseline[name]["min"], 1e-6)
+        flag = " REGRESSION" if ratio > TOLERANCE and result["min"] - baseline[name]["min"] > NOISE else ""
+        print(f"{name:<48} {result['min']:>10.3f} ms  x{ratio:.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+# Launching the benchmarks
+if __name__ == "__main__":
+    names = [arg for arg in argv[1:] if not arg.startswith("--")]
+    engine = Game.GameEngine()
+    results: dict[str, dict[str, float]] = {}
+
+    bench_tile(results)
+    maps = [(name, name) for name in SHIPPED_MAPS]
+    maps += [(make_synthetic(*size), f"synthetic_{size[0]}x{size[1]}") for size in (QUICK_SIZES if "--quick" in argv else SYNTHETIC_SIZES)]
+    for name, label in maps:
+        if names and label not in names:
+            continue
+        bench_map(results, name, label)
+        bench_overworld(results, engine, name, label)
+
+    with open(RESULTS_PATH, "w") as file:
+        dump(results, file, indent=4, sort_keys=True)
+
+    baseline: dict[str, dict[str, float]] = {}
+    if exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r") as file:
+            baseline = load(file)
+    regressions = compare(results, baseline)
+
+    if "--save" in argv:
+        with open(BASELINE_PATH, "w") as file:
+            dump(results, file, indent=4, sort_keys=True)
+    exit(1 if regressions else 0)
@@ -0,0 +1,36 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self
+from pygame import Rect
+
+# Import game components
+from .constants import CAMERA as cts
+
+
+# Create the Camera object
+class Camera:
+    """
+    Instance of a Camera object
+
+    The camera is a pixel rect looking at a part of a map,
+    it never shows anything outside of the map bounds
+    """
+    def __init__(self: Self, bounds: tuple[int, int], size: tuple[int, int]=cts.size) -> None:
+        self.bounds: tuple[int, int] = bounds
+        self.rect: Rect = Rect((0, 0), size)
+        self.speed: int = cts.speed
+        
+    def get_rect(self: Self) -> Rect:
+        return self.rect.copy()
+        
+    def move_to(self: Self, x: int, y: int) -> None:
+        # The camera stays at 0 on axes where the map is smaller than the view
+        self.rect.x = max(0, min(self.bounds[0] - self.rect.width, x))
+        self.rect.y = max(0, min(self.bounds[1] - self.rect.height, y))
+        
+    def move(self: Self, dx: int, dy: int) -> None:
+        self.move_to(self.rect.x + dx, self.rect.y + dy)
+        
+    def center_on(self: Self, x: int, y: int) -> None:
+        self.move_to(x - self.rect.width//2, y - self.rect.height//2)
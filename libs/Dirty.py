@@ -0,0 +1,46 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self
+from pygame import Rect
+
+
+# Create the Dirty rects tracker
+class DirtyTracker:
+    """
+    This object collects the regions of the screen changed since
+    the last display update
+
+    Overlapping regions are merged so each pixel is sent only once
+    """
+    def __init__(self: Self, size: tuple[int, int]) -> None:
+        self.screen_rect: Rect = Rect((0, 0), size)
+        self.rects: list[Rect] = []
+        
+    def mark(self: Self, rect: Rect) -> None:
+        rect = rect.clip(self.screen_rect)
+        if not (rect.width and rect.height):
+            return
+        
+        # We absorb every rect overlapping the new one until none is left
+        merged = True
+        while merged:
+            merged = False
+            for i, other in enumerate(self.rects):
+                if rect.colliderect(other):
+                    rect.union_ip(self.rects.pop(i))
+                    merged = True
+                    break
+        self.rects.append(rect)
+        
+    def mark_all(self: Self) -> None:
+        self.rects = [self.screen_rect.copy()]
+        
+    def is_dirty(self: Self) -> bool:
+        return bool(self.rects)
+    
+    def get_rects(self: Self) -> list[Rect]:
+        return self.rects
+    
+    def clear(self: Self) -> None:
+        self.rects = []
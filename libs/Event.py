@@ -1,28 +1,82 @@
 #-*-coding:utf-8-*-
 
 # Import built-in modules
-from typing import Self
-from pygame.locals import QUIT, KEYDOWN, KEYUP, K_F4, KMOD_ALT
+from typing import Self, Callable
+from pygame.locals import QUIT, KEYDOWN, KEYUP, K_F2, K_F3, K_F4, KMOD_ALT
 from pygame.event import get as getevents
 from pygame.time import get_ticks
 from os.path import exists
 from json import load, dump
+import numpy as np
 
 # Import game components
 from .constants import EVENTS as cts
+from .Timer import Timer, Scheduler
+
+# Create the FixedClock object
+class FixedClock:
+    """
+    Clock moving forward by a fixed step on each tick whatever the real time
+
+    It never waits, so replays run as fast as possible and always see the same times
+    """
+    def __init__(self: Self, step: float) -> None:
+        self.step: float = step
+        self.time: float = 0
+        
+    def tick(self: Self, framerate: int=0) -> float:
+        self.time += self.step
+        return self.step
+    
+    def get_ticks(self: Self) -> int:
+        return round(self.time)
+
 
 # Create the Event Manager
 class EventManager:
     """
     This object handle all pygame events and translate them to something
     our game can understand
+
+    Actions bound to keys are stored in arrays indexed through a key to
+    actions index, other events only last for the frame they happened in
     """
     def __init__(self: Self) -> None:
         self.event_map: dict[str, list[int]] = {}
         self.events: dict[str, bool] = {event:False for event in cts.default_events}
-        self.timers: dict[str, list[int | bool]] = {}
+        self.triggered: list[str] = []
+        self.timers: dict[str, Timer] = {}
+        self.action_names: list[str] = []
+        self.actions: dict[str, int] = {}
+        self.key_actions: dict[int, list[int]] = {}
+        self.key_counts: np.ndarray = np.zeros(0, np.int8)
+        self.held: np.ndarray = np.zeros(0, np.bool_)
+        self.pressed: np.ndarray = np.zeros(0, np.bool_)
+        self.released: np.ndarray = np.zeros(0, np.bool_)
+        self.held_frames: np.ndarray = np.zeros(0, np.int32)
+        self.frame: int = 0
+        self.get_ticks: Callable[[], int] = get_ticks
+        self.recording: list[list[int | str]] | None = None
+        self.record_path: str = ""
+        self.replay_inputs: list[list[int | str]] = []
+        self.replay_end: int = -1
+        self.scheduler: Scheduler = Scheduler(lambda: self.get_ticks())
         self.load_controls()
         
+    def build_index(self: Self) -> None:
+        # Only done when bindings change, so handling a key does not depend on the number of bindings
+        self.action_names = list(self.event_map)
+        self.actions = {name: i for i, name in enumerate(self.action_names)}
+        self.key_actions = {}
+        for name, keys in self.event_map.items():
+            for key in keys:
+                self.key_actions.setdefault(key, []).append(self.actions[name])
+        self.key_counts = np.zeros(len(self.actions), np.int8)
+        self.held = np.zeros(len(self.actions), np.bool_)
+        self.pressed = np.zeros(len(self.actions), np.bool_)
+        self.released = np.zeros(len(self.actions), np.bool_)
+        self.held_frames = np.zeros(len(self.actions), np.int32)
+        
     def load_controls(self: Self) -> None:
         if exists(cts.config_path):
             # We have a custom config stored
@@ -39,6 +93,7 @@ class EventManager:
                 "MoveRight": cts.default_move_right,
             }
             self.save_controls()
+        self.build_index()
             
     def save_controls(self: Self) -> None:
         with open(cts.config_path, "w") as file:
@@ -50,55 +105,158 @@ class EventManager:
     def remove_event(self: Self, name: str) -> None:
         self.events.pop(name, None)
         
-    def add_timer(self: Self, name: str, duration: int, repeat: bool=False) -> None:
+    def add_timer(self: Self, name: str, duration: int, repeat: bool=False, callback: Callable[[], None] | None=None) -> Timer:
+        # Named timers trigger their event when they expire, a timer with the same name is replaced
+        self.kill_timer(name)
         self.add_event(name)
-        self.timers[name] = [get_ticks(), duration, repeat]
+        self.timers[name] = self.scheduler.schedule(duration, repeat, callback, name)
+        return self.timers[name]
+    
+    def schedule(self: Self, duration: int, callback: Callable[[], None], repeat: bool=False) -> Timer:
+        # Timers without event only call back, the returned handle cancels them
+        return self.scheduler.schedule(duration, repeat, callback)
         
     def kill_timer(self: Self, name: str) -> None:
-        self.remove_event(name)
-        self.timers.pop(name, None)
+        if name in self.timers:
+            self.timers.pop(name).cancel()
+            self.remove_event(name)
         
     def kill_timers(self: Self) -> None:
-        for timer_name in list(self.timers.keys()):
-            self.kill_timer(timer_name)
+        for name in self.timers:
+            self.remove_event(name)
+        self.timers = {}
+        self.scheduler.clear()
             
     def update_event(self: Self, event_name: str, keys: list[int]) -> None:
         self.event_map[event_name] = keys
         self.save_controls()
+        self.build_index()
+        
+    def trigger(self: Self, name: str) -> None:
+        self.events[name] = True
+        self.triggered.append(name)
         
     def get_event(self: Self, name: str) -> bool:
+        # Actions are true while held
+        if name in self.actions:
+            return bool(self.held[self.actions[name]])
         return self.events.get(name, False)
     
-    def handle_events(self: Self) -> None:
-        # We reset all events except keyboard events
-        for event in set(self.events) - set(self.event_map):
-            self.events[event] = False
+    def is_pressed(self: Self, name: str) -> bool:
+        return name in self.actions and bool(self.pressed[self.actions[name]])
+    
+    def is_released(self: Self, name: str) -> bool:
+        return name in self.actions and bool(self.released[self.actions[name]])
+    
+    def get_repeat(self: Self, name: str, delay: int=cts.repeat_delay, interval: int=cts.repeat_interval) -> bool:
+        # True when the action is pressed, then every interval frames once it has been held for delay frames
+        if name not in self.actions:
+            return False
+        index = self.actions[name]
+        frames = int(self.held_frames[index])
+        return bool(self.pressed[index]) or (bool(self.held[index]) and frames >= delay and not (frames - delay) % interval)
+    
+    def press_key(self: Self, key: int) -> None:
+        self.apply_input("trigger", "Pressed")
+        for index in self.key_actions.get(key, ()):
+            self.apply_input("press", self.action_names[index])
+                
+    def release_key(self: Self, key: int) -> None:
+        self.apply_input("trigger", "Release")
+        for index in self.key_actions.get(key, ()):
+            self.apply_input("release", self.action_names[index])
+            
+    def apply_input(self: Self, kind: str, name: str) -> None:
+        # Every input is translated to one of these entries, so it can be recorded and replayed
+        if self.recording is not None:
+            self.recording.append([self.frame, kind, name])
+        if kind == "trigger":
+            self.trigger(name)
+        elif name in self.actions:
+            index = self.actions[name]
+            if kind == "press":
+                # An action bound to several keys stays held until all of them are released
+                self.key_counts[index] += 1
+                if self.key_counts[index] == 1:
+                    self.held[index] = self.pressed[index] = True
+                    self.held_frames[index] = 0
+            elif kind == "release" and self.key_counts[index]:
+                self.key_counts[index] -= 1
+                if not self.key_counts[index]:
+                    self.held[index] = False
+                    self.released[index] = True
+                    
+    def start_recording(self: Self, path: str) -> None:
+        self.recording = []
+        self.record_path = path
+        
+    def save_recording(self: Self) -> None:
+        if self.recording is None:
+            return
+        with open(self.record_path, "w") as file:
+            dump({"frames": self.frame, "inputs": self.recording}, file)
+        self.recording = None
             
-        # We handle pygame events
+    def start_replay(self: Self, path: str, get_ticks: Callable[[], int]) -> None:
+        # Inputs come from the file instead of pygame and timers use the given clock
+        with open(path, "r") as file:
+            data = load(file)
+        self.replay_inputs = data["inputs"][::-1]
+        self.replay_end = data["frames"]
+        self.get_ticks = get_ticks
+    
+    def read_events(self: Self) -> None:
         for event in getevents():
             if event.type == QUIT:
-                self.events["Quit"] = True
+                self.trigger("Quit")
             elif event.type == KEYDOWN and event.key == K_F4 and event.mod == KMOD_ALT:
-                self.events["Quit"] = True
+                self.trigger("Quit")
+            elif event.type == KEYDOWN and event.key == K_F3:
+                self.trigger("Profiler")
+            elif event.type == KEYDOWN and event.key == K_F2:
+                self.trigger("ProfilerTrace")
             elif event.type == KEYDOWN:
-                self.events["Pressed"] = True
-                for name, keys in self.event_map.items():
-                    if event.key in keys:
-                        self.events[name] = True
+                self.press_key(event.key)
             elif event.type == KEYUP:
-                self.events["Release"] = True
-                for name, keys in self.event_map.items():
-                    if event.key in keys:
-                        self.events[name] = False
+                self.release_key(event.key)
+            elif event.type == cts.music_end:
+                self.trigger("MusicEnd")
             else:
                 pass
+                
+    def replay_events(self: Self) -> None:
+        # Pygame events are still read so the window keeps answering, the game quits once the replay is over
+        for event in getevents():
+            if event.type == QUIT:
+                self.trigger("Quit")
+            elif event.type == cts.music_end:
+                self.trigger("MusicEnd")
+        while self.replay_inputs and self.replay_inputs[-1][0] == self.frame:
+            frame, kind, name = self.replay_inputs.pop()
+            self.apply_input(str(kind), str(name))
+        if self.frame > self.replay_end:
+            self.trigger("Quit")
+    
+    def handle_events(self: Self) -> None:
+        self.frame += 1
+        
+        # Events only last one frame, and edges of actions too
+        for name in self.triggered:
+            self.events[name] = False
+        self.triggered = []
+        self.pressed[:] = False
+        self.released[:] = False
+        self.held_frames[self.held] += 1
+            
+        # Inputs come from pygame, or from the replayed file
+        if self.replay_end >= 0:
+            self.replay_events()
+        else:
+            self.read_events()
             
-        # We handle custom timer events
-        current_time: int = get_ticks()
-        for name in list(self.timers.keys()):
-            if current_time - self.timers[name][0] >= self.timers[name][1]:
-                self.events[name] = True
-                if self.timers[name][2]:
-                    self.timers[name][0] = current_time
-                else:
-                    self.kill_timer(name)
+        # We handle custom timer events, only expired timers are looked at
+        for timer in self.scheduler.update():
+            if timer.name and self.timers.get(timer.name) is timer:
+                self.trigger(timer.name)
+                if not timer.repeat:
+                    del self.timers[timer.name]
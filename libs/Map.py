@@ -1,15 +1,22 @@
 #-*-coding:utf-8-*-
 
 # Import built-in modules
-from typing import Self, Any
-from os.path import join
-from json import load as jsload
-from pygame.image import load
-from pygame.time import get_ticks
-from pygame import Surface, Rect
+from typing import Self, Any, Iterator
+from collections import OrderedDict
+from os import makedirs, replace
+from os.path import join, exists, splitext, getmtime
+from threading import Lock, get_ident
+from json import load as jsload, dump as jsdump, dumps
+from hashlib import sha1
+from pygame.image import load, save
+from pygame import Surface, Rect, error
+import numpy as np
 
 # Import game components
 from .constants import MAP as cts
+from .Camera import Camera
+from .Resource import resources
+from . import MapFile
 
 # Create constants of the module
 BITMASKS: dict[str, list[int]] = {
@@ -48,12 +55,87 @@ BITMASKS_VARIANTS: dict[str, list[dict[str, tuple[int, int]]]] = {
         {"tl":(0, 0), "tr":(0, 0), "br":(0, 0), "bl":(0, 0)}
     ]
 }
+CORNERS: list[str] = ["tl", "tr", "bl", "br"]
+OFFSETS: list[tuple[int, int]] = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+OUTSIDE: int = -2
 GRAPHICS_FORMATS: dict[str, tuple[int, int]] = {
     "field": (2, 3),
     "wall": (2, 2),
     "fall": (2, 1),
     "unique": (1, 1)
 }
+ATLAS_VERSION: int = 1
+
+
+# Create helper functions of the module
+def get_variant(mask: int) -> tuple[int, ...]:
+    variant = []
+    for corner in CORNERS:
+        # We generate a bitmask of the corner according to the neighborhood mask
+        bitmask = sum([((mask >> bit) & 1) << j for j, bit in enumerate(BITMASKS[corner])])
+        
+        # Then we pick the right corner variant according to bitmask
+        variant.append(bitmask//2+int(bitmask==7))
+    return tuple(variant)
+
+
+def get_masks(tiles: np.ndarray, x: int, y: int, width: int, height: int) -> np.ndarray:
+    # We copy the region with a border of one tile, cells outside the map count as same tiles
+    window = np.full((height+2, width+2), OUTSIDE, np.int16)
+    left, top = max(0, x-1), max(0, y-1)
+    right, bottom = min(tiles.shape[1], x+width+1), min(tiles.shape[0], y+height+1)
+    window[top-y+1:bottom-y+1, left-x+1:right-x+1] = tiles[top:bottom, left:right]
+    
+    # Then we compare each shifted window with the region to build the bitmask
+    center = window[1:-1, 1:-1]
+    masks = np.zeros((height, width), np.uint8)
+    for bit, (dx, dy) in enumerate(OFFSETS):
+        neighbor = window[1+dy:height+1+dy, 1+dx:width+1+dx]
+        masks |= ((neighbor == center) | (neighbor == OUTSIDE)).astype(np.uint8) << bit
+    return masks
+
+
+def get_page_lock(path: str) -> Lock:
+    # Each atlas page has its own lock, so pages of different files are baked at the same time
+    with page_locks_lock:
+        return page_locks.setdefault(path, Lock())
+
+
+VARIANTS: list[tuple[int, ...]] = [get_variant(mask) for mask in range(256)]
+VARIANT_LIST: list[tuple[int, ...]] = sorted(set(VARIANTS))
+page_locks: dict[str, Lock] = {}
+page_locks_lock: Lock = Lock()
+
+
+# Create the AnimationClock object
+class AnimationClock:
+    """
+    Clock shared by all tiles to pick their animation frame
+
+    It moves forward by a fixed step on each tick so frames only
+    depend on the number of ticks and not on the real time,
+    tools without a fixed framerate can give the elapsed time instead
+    """
+    def __init__(self: Self, step: float=1000/cts.update_fps) -> None:
+        # Steps are counted instead of summed, so the time neither truncates nor drifts
+        self.step: float = step
+        self.ticks: int = 0
+        self.elapsed: float = 0
+        
+    def get_time(self: Self) -> float:
+        return self.ticks*self.step + self.elapsed
+        
+    def tick(self: Self, elapsed: float | None=None) -> None:
+        if elapsed is None:
+            self.ticks += 1
+        else:
+            self.elapsed += elapsed
+        
+    def get_frame(self: Self, delay: int, frames: int) -> int:
+        return int(self.get_time() // delay) % frames
+
+
+animation_clock: AnimationClock = AnimationClock()
 
 
 # Create the Tile object
@@ -61,158 +143,786 @@ class Tile:
     """
     Instance of a Tile object
     """
-    def __init__(self: Self, tile_id: int, type: str, size: int, hitbox: int, graphics: list[Surface], animation_delay: int=333) -> None:
+    def __init__(self: Self, tile_id: int, type: str, size: int, hitbox: int, graphics: list[Surface], animation_delay: int=333, frames: int | None=None, file: str="", tileset: "Tileset | None"=None) -> None:
         self.tile_id: int = tile_id
         self.type: str = type
         self.size = size
         self.hitbox: int = hitbox
         self.animation_delay = animation_delay
-        self.current_frame = 0
-        self.last_tick_update = 0
         self.graphics: list[Surface] = graphics
+        # Tiles of a tileset have no source graphics, only their frame count and the page holding them
+        self.frames: int = len(graphics) if frames is None else frames
+        self.animated: bool = self.frames > 1
+        self.file: str = file
+        self.tileset: Tileset | None = tileset
+        self.cache: dict[tuple[int, tuple[int, ...]], Surface] = {}
+    
+    def get_layout(self: Self, variant: tuple[int, ...]) -> tuple[tuple[int, int], ...]:
+        # Variants picking the same corners give the same graphic
+        return tuple(BITMASKS_VARIANTS[self.type][variant[i]][corner] for i, corner in enumerate(CORNERS))
     
-    def get_tile(self: Self, neighborhood: list[int]) -> Surface:
+    def bake(self: Self, frame: int, variant: tuple[int, ...], convert: bool=True) -> Surface:
         tile = Surface((self.size, self.size), cts.flags)
         
-        tick = get_ticks()
-        if tick - self.last_tick_update > self.animation_delay:
-            self.last_tick_update = tick
-            self.current_frame = (self.current_frame + 1) % len(self.graphics)
-        
-        # Pick correct graphics according to parameters
-        for i, corner in enumerate(["tl", "tr", "bl", "br"]):
+        # Pick correct graphics according to variant
+        for i, corner in enumerate(CORNERS):
             # First we calcul the offset of the corner
             offsetx, offsety = (self.size//2) * (i%2), (self.size//2) * (i//2)
             
-            #Then we generate a bitmask according to neighborhood
-            bitmask = sum([neighborhood[bit]*2**j for j, bit in enumerate(BITMASKS[corner])])
+            # Then we pick the right corner graphic
+            x, y = BITMASKS_VARIANTS[self.type][variant[i]][corner]
+            corner_graphic = self.graphics[frame].subsurface(Rect(x*self.size+offsetx, y*self.size+offsety, self.size//2, self.size//2))
             
-            # Then we pick the right corner according to bitmask
-            x, y = BITMASKS_VARIANTS[self.type][bitmask//2+int(bitmask==7)][corner]
-            corner_graphic = self.graphics[self.current_frame].subsurface(Rect(x*self.size+offsetx, y*self.size+offsety, self.size//2, self.size//2))
-            
-            # Then e blit it on our tile
+            # Then we blit it on our tile
             tile.blit(corner_graphic, (offsetx, offsety))
             
-        # Finally we return the graphic of our tile
-        return tile.convert_alpha()
+        # Finally we return the graphic of our tile, only converted when the display can be used
+        return tile.convert_alpha() if convert else tile
+    
+    def get_frame(self: Self) -> int:
+        return animation_clock.get_frame(self.animation_delay, self.frames)
+    
+    def get_tile(self: Self, mask: int, frame: int | None=None) -> Surface:
+        frame = self.get_frame() if frame is None else frame
+        
+        # Composed tiles are baked once and then shared, callers must not draw on them
+        key = (frame, VARIANTS[mask])
+        tile = self.cache.get(key)
+        if tile is None:
+            if self.tileset is not None:
+                # The page of the tile is only loaded the first time one of its tiles is drawn
+                self.tileset.load_page(self.file)
+                return self.cache[key]
+            tile = self.bake(*key)
+            self.cache[key] = tile
+        return tile
     
 
 # Create the Tileset object
 class Tileset:
     """
     Tileset Object
+    
+    Tiles are baked with all their variants and frames on one atlas page
+    per tileset image, pages are cached on disk and only loaded on use
+    
+    Maps share tilesets through the resource manager, see get_tileset
     """
     def __init__(self: Self, name: str) -> None:
         self.name = name
         self.tile_size: int = 0
         self.tiles: list[Tile] = []
+        self.files: dict[str, list[dict[str, Any]]] = {}
+        self.pages: dict[str, int] = {}
+        self.held_pages: list[str] = []
+        self.animated: np.ndarray
         self.load_json()
         
     def load_json(self: Self) -> None:
         with open(join(cts.tileset_folder, f"{self.name}.json"), "r") as file:
             data = jsload(file)
-            tile_size = data["tile_size"]
-            self.tile_size = tile_size
-            graphics = {filename: load(join(cts.tileset_graphics_folder, self.name, filename)).convert_alpha() for filename in data["files"]}
-            for i, tile_infos in enumerate(data["tiles"]):
-                tile_graphics = []
-                for frame in tile_infos["frames"]:
-                    x, y = frame[0]*tile_size, frame[1]*tile_size
-                    sizex, sizey = GRAPHICS_FORMATS[tile_infos["type"]][0]*tile_size, GRAPHICS_FORMATS[tile_infos["type"]][1]*tile_size
-                    tile_graphics.append(graphics[tile_infos["file"]].subsurface(Rect(x, y, sizex, sizey)))
-                self.tiles.append(Tile(i, tile_infos["type"], tile_size, tile_infos["hitbox"], tile_graphics))
-            file.close()
+        self.tile_size = data["tile_size"]
+        
+        # No image is read here, tiles only know which file holds them
+        for i, tile_infos in enumerate(data["tiles"]):
+            self.files.setdefault(tile_infos["file"], []).append(dict(tile_infos, id=i))
+            self.tiles.append(Tile(i, tile_infos["type"], self.tile_size, tile_infos["hitbox"], [], frames=len(tile_infos["frames"]), file=tile_infos["file"], tileset=self))
+        
+        # Empty cells use id -1 so they pick the last entry of the lookup
+        self.animated = np.array([tile.animated for tile in self.tiles] + [False])
+        
+    def get_cache_key(self: Self, filename: str) -> str:
+        # The key changes whenever the tiles of the file, the image or the baking changes
+        key = sha1(dumps([ATLAS_VERSION, self.tile_size, self.files[filename]], sort_keys=True).encode("utf-8"))
+        with open(self.get_source_path(filename), "rb") as file:
+            key.update(file.read())
+        return key.hexdigest()
+    
+    def get_source_path(self: Self, filename: str) -> str:
+        return join(cts.tileset_graphics_folder, self.name, filename)
+    
+    def get_page_paths(self: Self, filename: str) -> tuple[str, str]:
+        path = join(cts.tileset_cache_folder, self.name, splitext(filename)[0])
+        return f"{path}.png", f"{path}.json"
+    
+    def get_slot_rect(self: Self, slot: int) -> Rect:
+        return Rect((slot % cts.atlas_columns)*self.tile_size, (slot // cts.atlas_columns)*self.tile_size, self.tile_size, self.tile_size)
+    
+    def acquire_page(self: Self, filename: str) -> None:
+        # Pages are shared through the resource manager by the path of their source image, each user holds a reference
+        page, slots = resources.acquire(self.get_source_path(filename), lambda: self.read_page(filename))
+        self.pages[filename] = self.pages.get(filename, 0) + 1
+        if self.pages[filename] > 1:
+            return
+        
+        # Every variant of every frame is a subsurface of the page, so nothing is baked at runtime
+        for tile_infos in self.files[filename]:
+            tile = self.tiles[tile_infos["id"]]
+            for frame, frame_slots in enumerate(slots[str(tile.tile_id)]):
+                for variant, slot in zip(VARIANT_LIST, frame_slots):
+                    tile.cache[(frame, variant)] = page.subsurface(self.get_slot_rect(slot))
+    
+    def release_page(self: Self, filename: str) -> None:
+        if filename not in self.pages:
+            return
+        resources.release(self.get_source_path(filename))
+        
+        # Once nobody uses the page its subsurfaces are dropped, so only the resource manager keeps it
+        self.pages[filename] -= 1
+        if not self.pages[filename]:
+            del self.pages[filename]
+            for tile_infos in self.files[filename]:
+                self.tiles[tile_infos["id"]].cache.clear()
+    
+    def load_page(self: Self, filename: str) -> None:
+        # Tiles drawn outside of a map make the tileset hold their page until it is evicted
+        if filename not in self.held_pages:
+            self.held_pages.append(filename)
+            self.acquire_page(filename)
+    
+    def read_page_file(self: Self, filename: str) -> tuple[Surface, dict[str, list[list[int]]]] | None:
+        # Pages are only decoded here, so it can run outside of the main thread
+        page_path, index_path = self.get_page_paths(filename)
+        if not exists(page_path) or not exists(index_path):
+            return None
+        
+        # A damaged cache file is baked again instead of stopping the game
+        try:
+            with open(index_path, "r") as file:
+                index = jsload(file)
+            if index["key"] != self.get_cache_key(filename) or index["columns"] != cts.atlas_columns:
+                return None
+            return load(page_path), index["tiles"]
+        except (OSError, ValueError, KeyError, TypeError, error):
+            return None
+    
+    def decode_page(self: Self, filename: str) -> tuple[Surface, dict[str, list[list[int]]]]:
+        # Nothing here touches the display, so pages can be decoded or baked outside of the main thread
+        cached = self.read_page_file(filename)
+        if cached is not None:
+            return cached
+        
+        # Workers may need the same page, it is only baked once and the others read it
+        page_path, index_path = self.get_page_paths(filename)
+        with get_page_lock(page_path):
+            cached = self.read_page_file(filename)
+            if cached is not None:
+                return cached
+            
+            # The page is missing or outdated so we bake it again from its source image
+            key = self.get_cache_key(filename)
+            page, slots = self.bake_page(filename)
+            makedirs(join(cts.tileset_cache_folder, self.name), exist_ok=True)
+            
+            # Files are written aside then moved, so a reader never sees half of one
+            temp_path = f"{splitext(page_path)[0]}.{get_ident()}.tmp"
+            save(page, f"{temp_path}.png")
+            replace(f"{temp_path}.png", page_path)
+            with open(f"{temp_path}.json", "w") as file:
+                jsdump({"key": key, "columns": cts.atlas_columns, "tiles": slots}, file)
+            replace(f"{temp_path}.json", index_path)
+        return page, slots
+    
+    def read_page(self: Self, filename: str) -> tuple[Surface, dict[str, list[list[int]]]]:
+        page, slots = self.decode_page(filename)
+        return page.convert_alpha(), slots
+    
+    def bake_page(self: Self, filename: str) -> tuple[Surface, dict[str, list[list[int]]]]:
+        tile_size = self.tile_size
+        source = load(self.get_source_path(filename))
+        
+        # We give a slot to each distinct graphic of each frame of each tile of the file
+        slots: dict[str, list[list[int]]] = {}
+        graphics: list[Surface] = []
+        for tile_infos in self.files[filename]:
+            sizex, sizey = GRAPHICS_FORMATS[tile_infos["type"]][0]*tile_size, GRAPHICS_FORMATS[tile_infos["type"]][1]*tile_size
+            tile_graphics = [source.subsurface(Rect(frame[0]*tile_size, frame[1]*tile_size, sizex, sizey)) for frame in tile_infos["frames"]]
+            tile = Tile(tile_infos["id"], tile_infos["type"], tile_size, tile_infos["hitbox"], tile_graphics)
+            tile_slots = []
+            for frame in range(tile.frames):
+                layouts: dict[tuple[tuple[int, int], ...], int] = {}
+                frame_slots = []
+                for variant in VARIANT_LIST:
+                    layout = tile.get_layout(variant)
+                    if layout not in layouts:
+                        layouts[layout] = len(graphics)
+                        graphics.append(tile.bake(frame, variant, False))
+                    frame_slots.append(layouts[layout])
+                tile_slots.append(frame_slots)
+            slots[str(tile.tile_id)] = tile_slots
+        
+        # Then we paste them on the page
+        rows = max(1, (len(graphics)-1)//cts.atlas_columns + 1)
+        page = Surface((cts.atlas_columns*tile_size, rows*tile_size), cts.flags)
+        for slot, graphic in enumerate(graphics):
+            page.blit(graphic, self.get_slot_rect(slot))
+        return page, slots
+    
+    def release(self: Self) -> None:
+        # Pages held by the tileset are given back so the resource manager can free them, maps give back their own
+        for filename in self.held_pages:
+            self.release_page(filename)
+        self.held_pages = []
             
+    def get_files(self: Self, tiles: np.ndarray) -> set[str]:
+        # Files holding the tiles used by a map
+        return {self.tiles[tile_id].file for tile_id in np.unique(tiles) if tile_id >= 0}
+    
     def get_tile(self: Self, id: int) -> Tile | None:
         if id != -1:
             return self.tiles[id]
         else:
             return None
+        
+        
+def get_tileset(name: str) -> Tileset:
+    # Tilesets are acquired by the path of their json, they release their pages once evicted
+    return resources.acquire(join(cts.tileset_folder, f"{name}.json"), lambda: Tileset(name), Tileset.release)
+
+
+def release_tileset(name: str) -> None:
+    resources.release(join(cts.tileset_folder, f"{name}.json"))
+
+
+# Create the MapView object
+class MapView:
+    """
+    Back buffer showing a group of layers of a Map through a camera
+
+    It keeps what it showed on last render so only newly exposed
+    or changed regions have to be drawn again
+    """
+    def __init__(self: Self, layer_ids: list[int]) -> None:
+        self.layer_ids: list[int] = layer_ids
+        self.surface: Surface | None = None
+        self.view: Rect | None = None
+        self.redraw: list[Rect] = []
+        
+    def mark_redraw(self: Self, rect: Rect) -> None:
+        # A view not rendered for a long time is simply drawn again from scratch
+        if len(self.redraw) < cts.max_redraw:
+            self.redraw.append(rect)
+        else:
+            self.view = None
+            self.redraw.clear()
+        
+    def get_regions(self: Self, view: Rect) -> list[Rect]:
+        # First render or jump farther than the view, everything has to be drawn
+        previous = self.view
+        if self.surface is None or previous is None or previous.size != view.size or not previous.colliderect(view):
+            self.surface = self.surface if self.surface and self.surface.get_size() == view.size else Surface(view.size, cts.flags)
+            self.redraw.clear()
+            return [view]
+        
+        # Else we keep what is still visible and shift it
+        dx, dy = view.x - previous.x, view.y - previous.y
+        self.surface.scroll(-dx, -dy)
+        
+        # Then only strips the previous view did not show and changed regions have to be drawn
+        regions = self.redraw
+        self.redraw = []
+        if dx > 0:
+            regions.append(Rect(previous.right, view.top, dx, view.height))
+        elif dx < 0:
+            regions.append(Rect(view.left, view.top, -dx, view.height))
+        if dy > 0:
+            regions.append(Rect(view.left, previous.bottom, view.width, dy))
+        elif dy < 0:
+            regions.append(Rect(view.left, view.top, view.width, -dy))
+        return regions
+
+
+# Create accessors giving a nested view of the tiles of a Map
+class TileRow:
+    """
+    Row of tiles of a Map layer
+    """
+    def __init__(self: Self, map: "Map", layer_id: int, tile_y: int) -> None:
+        self.map = map
+        self.layer_id: int = layer_id
+        self.tile_y: int = tile_y
+        
+    def __len__(self: Self) -> int:
+        return self.map.size[0]
+    
+    def __iter__(self: Self) -> Iterator[Tile | None]:
+        for tile_x in range(self.map.size[0]):
+            yield self.map.get_tile(self.layer_id, tile_x, self.tile_y)
+    
+    def __getitem__(self: Self, tile_x: int) -> Tile | None:
+        return self.map.get_tile(self.layer_id, tile_x, self.tile_y)
+    
+    def __setitem__(self: Self, tile_x: int, tile: Tile | None) -> None:
+        self.map.set_tile(self.layer_id, tile_x, self.tile_y, tile)
+
+
+class TileLayer:
+    """
+    Layer of tiles of a Map
+    """
+    def __init__(self: Self, map: "Map", layer_id: int) -> None:
+        self.map = map
+        self.layer_id: int = layer_id
+        
+    def __len__(self: Self) -> int:
+        return self.map.size[1]
+    
+    def __iter__(self: Self) -> Iterator[TileRow]:
+        for tile_y in range(self.map.size[1]):
+            yield TileRow(self.map, self.layer_id, tile_y)
+    
+    def __getitem__(self: Self, tile_y: int) -> TileRow:
+        return TileRow(self.map, self.layer_id, tile_y)
+
+
+class Tilemap:
+    """
+    Nested view of the tile array of a Map
+
+    tilemap[layer_id][y][x] reads and writes Tile objects
+    while tiles are stored as ids in Map.tiles
+    """
+    def __init__(self: Self, map: "Map") -> None:
+        self.map = map
+        
+    def __len__(self: Self) -> int:
+        return self.map.layer_id_range[-1] - self.map.layer_id_range[0]
+    
+    def __contains__(self: Self, layer_id: int) -> bool:
+        return self.map.layer_id_range[0] <= layer_id < self.map.layer_id_range[-1]
+    
+    def __iter__(self: Self) -> Iterator[int]:
+        return iter(range(*self.map.layer_id_range))
+    
+    def __getitem__(self: Self, layer_id: int) -> TileLayer:
+        if layer_id not in self:
+            raise KeyError(layer_id)
+        return TileLayer(self.map, layer_id)
+    
+    def keys(self: Self) -> list[int]:
+        return list(self)
+    
+    def items(self: Self) -> list[tuple[int, TileLayer]]:
+        return [(layer_id, TileLayer(self.map, layer_id)) for layer_id in self]
 
 
 # Create Map object
 class Map:
     """
     Instance of a Map object
+
+    Tiles are stored as ids in one int16 array of shape (layers, height, width)
+    with -1 for empty cells, tilemap gives a Tile based view of it
+
+    Streaming maps only keep chunks around the camera in memory, loading
+    them from their binary file when needed, and cannot be edited
     """
-    def __init__(self: Self, name: str) -> None:
+    def __init__(self: Self, name: str, streaming: bool=False) -> None:
         self.name: str = name
+        self.streaming: bool = streaming
+        self.map_file: MapFile.MapFile | None = None
+        self.data_key: tuple[str, float] | None = None
+        self.pages: set[str] = set()
+        self.resident: OrderedDict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = OrderedDict()
         self.size: list[int]
         self.bgm: str
         self.bgs: str
         self.layer_id_range: list[int]
+        self.connections: list[str]
         self.tileset: Tileset
-        self.tilemap: dict[int, list[list[Tile | None]]] = {}
+        self.tiles: np.ndarray
+        self.masks: np.ndarray
+        self.tilemap: Tilemap = Tilemap(self)
+        self.chunks: dict[tuple[int, int, int], Surface] = {}
+        self.chunks_frames: dict[tuple[int, int, int], list[int]] = {}
+        self.animated: dict[tuple[int, int, int], list[tuple[int, int]]] = {}
+        self.views: dict[Any, MapView] = {}
+        self.dirty_rects: list[Rect] = []
         
-        # Load map from json file
-        self.load_json()
+        # Load map from its binary or json file
+        self.load()
+        
+    def load(self: Self) -> None:
+        # Only binary maps can be streamed, json ones are always fully loaded
+        path = MapFile.get_path(self.name)
+        if self.streaming and not path.endswith(".json"):
+            self.map_file = MapFile.MapFile(path)
+            self.set_data(self.map_file.meta, None)
+        else:
+            # Map data is shared with other maps loaded from the same file until one of them edits it
+            self.streaming = False
+            self.data_key = (path, getmtime(path))
+            self.set_data(*resources.acquire(self.data_key, lambda: MapFile.read_file(path)))
+        
+    def unload(self: Self) -> None:
+        # Rendered chunks are dropped, the tileset and the map data are given back to the resource manager
+        self.reset()
+        self.release_data()
+        
+    def reset(self: Self) -> None:
+        # Everything rendered, indexed or streamed from the current data is dropped
+        self.chunks.clear()
+        self.chunks_frames.clear()
+        self.views.clear()
+        self.animated.clear()
+        self.resident.clear()
+        self.dirty_rects = []
+        if self.map_file is not None:
+            self.map_file.close()
+            self.map_file = None
+        self.streaming = False
+        
+    def release_data(self: Self) -> None:
+        # The pages, the tileset and the shared map data are given back before other ones are acquired
+        for filename in self.pages:
+            self.tileset.release_page(filename)
+        self.pages = set()
+        release_tileset(self.tileset.name)
+        if self.data_key is not None:
+            resources.release(self.data_key)
+            self.data_key = None
+        
+    def load_pages(self: Self) -> None:
+        # Pages holding the tiles of the map are acquired now instead of on the first render, streamed maps load them on use
+        if not self.streaming:
+            self.acquire_pages(self.tileset.get_files(self.tiles))
+        
+    def acquire_pages(self: Self, files: set[str]) -> None:
+        # The map holds a reference on each page it draws until it is unloaded
+        for filename in files - self.pages:
+            self.tileset.acquire_page(filename)
+            self.pages.add(filename)
         
     def load_json(self: Self) -> None:
-        with open(join(cts.map_folder, f"{self.name}.json"), "r") as file:
-            data = jsload(file)
-            self.size = data["size"]
-            self.bgm = data["bgm"]
-            self.bgs = data["bgs"]
-            self.layer_id_range = data["layer_id_range"]
-            self.tileset = Tileset(data["tileset"])
-            for layer in data["layers"]:
-                self.tilemap[layer["id"]] = [
-                    [
-                        self.tileset.get_tile(layer["tiles"][j][i]) for i in range(self.size[0])
-                    ] for j in range(self.size[1])
-                ]
-            file.close()
+        self.reset()
+        self.release_data()
+        self.set_data(*MapFile.read_json(join(cts.map_folder, f"{self.name}.json")))
+        
+    def load_binary(self: Self) -> None:
+        map_file = MapFile.MapFile(join(cts.map_folder, f"{self.name}{cts.binary_extension}"))
+        self.reset()
+        self.release_data()
+        self.set_data(map_file.meta, map_file.read_tiles())
+        map_file.close()
+        
+    def set_data(self: Self, meta: dict[str, Any], tiles: np.ndarray | None) -> None:
+        self.size = list(meta["size"])
+        self.bgm = meta["bgm"]
+        self.bgs = meta["bgs"]
+        self.layer_id_range = list(meta["layer_id_range"])
+        self.connections = list(meta.get("connections", []))
+        self.tileset = get_tileset(meta["tileset"])
+        if tiles is None:
+            return
+        self.tiles = tiles
+        self.masks = np.stack([get_masks(layer, 0, 0, *self.size) for layer in self.tiles])
+        chunks_x, chunks_y = (self.size[0]-1)//cts.chunk_size + 1, (self.size[1]-1)//cts.chunk_size + 1
+        for layer_id in self.tilemap:
+            self.index_animated(layer_id, Rect(0, 0, chunks_x, chunks_y))
+            
+    def get_meta(self: Self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": self.size,
+            "bgm": self.bgm,
+            "bgs": self.bgs,
+            "layer_id_range": self.layer_id_range,
+            "tileset": self.tileset.name,
+            "connections": self.connections
+        }
+            
+    def check_editable(self: Self) -> None:
+        if self.streaming:
+            raise ValueError(f"Map {self.name} is streamed and cannot be edited or saved")
+        
+        # Edited maps get their own copy of the shared tiles
+        if self.data_key is not None:
+            self.tiles = np.array(self.tiles)
+            resources.release(self.data_key)
+            self.data_key = None
+            
+    def save_json(self: Self, file_path: str) -> None:
+        self.check_editable()
+        MapFile.write_json(file_path, self.get_meta(), self.tiles)
+            
+    def save_binary(self: Self, file_path: str, compressed: bool=False) -> None:
+        self.check_editable()
+        MapFile.write_binary(file_path, self.get_meta(), self.tiles, compressed)
+            
+    def get_pixel_size(self: Self) -> tuple[int, int]:
+        return self.size[0]*self.tileset.tile_size, self.size[1]*self.tileset.tile_size
+            
+    def layer_index(self: Self, layer_id: int) -> int:
+        return layer_id - self.layer_id_range[0]
+
+    def get_tile(self: Self, layer_id: int, tile_x: int, tile_y: int) -> Tile | None:
+        if self.streaming:
+            tiles = self.get_chunk_data(tile_x//cts.chunk_size, tile_y//cts.chunk_size)[0]
+            return self.tileset.get_tile(int(tiles[self.layer_index(layer_id), tile_y%cts.chunk_size, tile_x%cts.chunk_size]))
+        return self.tileset.get_tile(int(self.tiles[self.layer_index(layer_id), tile_y, tile_x]))
+
+    def get_mask(self: Self, layer_id: int, tile_x: int, tile_y: int) -> int:
+        if self.streaming:
+            masks = self.get_chunk_data(tile_x//cts.chunk_size, tile_y//cts.chunk_size)[1]
+            return int(masks[self.layer_index(layer_id), tile_y%cts.chunk_size, tile_x%cts.chunk_size])
+        return int(self.masks[self.layer_index(layer_id), tile_y, tile_x])
 
     def get_neighborhood(self: Self, layer_id: int, tile_x: int, tile_y: int) -> list[int]:
-        offsets = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
-        neighborhood = []
-        tile = self.tilemap[layer_id][tile_y][tile_x]
-        
-        for i, (dx, dy) in enumerate(offsets):
-            nx, ny = tile_x+dx, tile_y+dy
-            if 0 <= nx < self.size[0] and 0 <= ny < self.size[1]:
-                neighbor = self.tilemap[layer_id][ny][nx]
-                if neighbor:
-                    neighborhood.append(int(neighbor.tile_id == tile.tile_id)) # type: ignore
-                else:
-                    neighborhood.append(0)
-            else:
-                neighborhood.append(1)
-        
-        return neighborhood
-            
-    def render_layers(self: Self, player_pos: tuple[int, int]) -> dict[int, Surface]:
-        tiles_x = cts.size[0]//self.tileset.tile_size + 2
-        tiles_y = cts.size[1]//self.tileset.tile_size + 2
-        
-        camera_x = max(0, player_pos[0] - tiles_x // 2)
-        camera_y = max(0, player_pos[1] - tiles_y // 2)
-        
-        layers = {}
-        
-        # Generate The different layers
-        for layer_id in range(*self.layer_id_range):
-            tiles = self.tilemap[layer_id]
-            
-            surface = Surface((tiles_x*self.tileset.tile_size, tiles_y*self.tileset.tile_size), cts.flags)
-            surface.fill((0, 0, 0, 0))
-            
-            for y in range(tiles_y):
-                for x in range(tiles_x):
-                    tile_x = camera_x + x
-                    tile_y = camera_y + y
-                    
-                    if 0 <= tile_y < len(tiles) and 0 <= tile_x < len(tiles[tile_y]):
-                        tile_obj = tiles[tile_y][tile_x]
-                        
-                        if tile_obj:
-                            neighborhood = self.get_neighborhood(layer_id, tile_x, tile_y)
-                            tile_graphic = tile_obj.get_tile(neighborhood)
-                            
-                            screen_pos = (x*self.tileset.tile_size, y*self.tileset.tile_size)
-                            surface.blit(tile_graphic, screen_pos)
-                            
-            layers[layer_id] = surface
-        
-        return layers
\ No newline at end of file
+        mask = self.get_mask(layer_id, tile_x, tile_y)
+        return [(mask >> bit) & 1 for bit in range(len(OFFSETS))]
+    
+    def add_layer(self: Self, layer_id: int) -> None:
+        self.check_editable()
+        
+        # New layers can only be added right under or above existing ones
+        empty = np.full((1, self.size[1], self.size[0]), -1, np.int16)
+        if layer_id == self.layer_id_range[0] - 1:
+            self.layer_id_range[0] -= 1
+            self.tiles = np.concatenate([empty, self.tiles])
+        elif layer_id == self.layer_id_range[-1]:
+            self.layer_id_range[-1] += 1
+            self.tiles = np.concatenate([self.tiles, empty])
+        else:
+            raise ValueError(f"Layer {layer_id} is not next to layers {self.layer_id_range}")
+        
+        self.masks = np.stack([get_masks(layer, 0, 0, *self.size) for layer in self.tiles])
+        self.chunks.clear()
+        self.chunks_frames.clear()
+        self.views.clear()
+    
+    def index_animated(self: Self, layer_id: int, chunks: Rect) -> None:
+        # We forget the animated cells of the given chunks then find them again in the tile array
+        chunk_size = cts.chunk_size
+        for chunk_x in range(chunks.left, chunks.right):
+            for chunk_y in range(chunks.top, chunks.bottom):
+                self.animated.pop((layer_id, chunk_x, chunk_y), None)
+                
+        left, top = chunks.left*chunk_size, chunks.top*chunk_size
+        region = self.tiles[self.layer_index(layer_id), top:chunks.bottom*chunk_size, left:chunks.right*chunk_size]
+        cells_y, cells_x = np.nonzero(self.tileset.animated[region])
+        for tile_x, tile_y in zip((cells_x + left).tolist(), (cells_y + top).tolist()):
+            self.animated.setdefault((layer_id, tile_x//chunk_size, tile_y//chunk_size), []).append((tile_x, tile_y))
+    
+    def mark_redraw(self: Self, layer_id: int, rect: Rect) -> None:
+        for view in self.views.values():
+            if layer_id in view.layer_ids:
+                view.mark_redraw(rect)
+    
+    def update_region(self: Self, layer_id: int, rect: Rect) -> None:
+        # Tiles around the region may change graphics too, so we work on the region and its border
+        index = self.layer_index(layer_id)
+        area = rect.inflate(2, 2).clip(Rect(0, 0, *self.size))
+        self.masks[index, area.top:area.bottom, area.left:area.right] = get_masks(self.tiles[index], *area)
+        
+        # Then we drop every chunk touching it and refresh their animated cells
+        chunk_size = cts.chunk_size
+        chunks = Rect(area.left//chunk_size, area.top//chunk_size, 0, 0)
+        chunks.size = ((area.right-1)//chunk_size + 1 - chunks.left, (area.bottom-1)//chunk_size + 1 - chunks.top)
+        for chunk_x in range(chunks.left, chunks.right):
+            for chunk_y in range(chunks.top, chunks.bottom):
+                self.chunks.pop((layer_id, chunk_x, chunk_y), None)
+                self.chunks_frames.pop((layer_id, chunk_x, chunk_y), None)
+        self.index_animated(layer_id, chunks)
+        
+        # Dropped chunks are drawn again on the next render, with their animated cells at the current frame
+        chunk_pixels = chunk_size*self.tileset.tile_size
+        self.mark_redraw(layer_id, Rect(chunks.x*chunk_pixels, chunks.y*chunk_pixels, chunks.width*chunk_pixels, chunks.height*chunk_pixels))
+    
+    def set_tile(self: Self, layer_id: int, tile_x: int, tile_y: int, tile: Tile | None) -> None:
+        self.check_editable()
+        self.tiles[self.layer_index(layer_id), tile_y, tile_x] = tile.tile_id if tile else -1
+        self.update_region(layer_id, Rect(tile_x, tile_y, 1, 1))
+        
+    def fill(self: Self, layer_id: int, rect: Rect, tile: Tile | None) -> None:
+        self.check_editable()
+        rect = rect.clip(Rect(0, 0, *self.size))
+        if rect.width and rect.height:
+            self.tiles[self.layer_index(layer_id), rect.top:rect.bottom, rect.left:rect.right] = tile.tile_id if tile else -1
+            self.update_region(layer_id, rect)
+            
+    def copy_region(self: Self, layer_id: int, rect: Rect, dest: tuple[int, int], dest_layer_id: int | None=None) -> None:
+        self.check_editable()
+        dest_layer_id = layer_id if dest_layer_id is None else dest_layer_id
+        
+        # We clip both source and destination regions to the map
+        bounds = Rect(0, 0, *self.size)
+        clipped = rect.clip(bounds)
+        # Cells clipped from the source are not copied, so the destination moves with the source
+        dest = (dest[0] + clipped.left - rect.left, dest[1] + clipped.top - rect.top)
+        rect = clipped
+        dest_rect = Rect(dest, rect.size).clip(bounds)
+        rect = Rect(rect.left + dest_rect.left - dest[0], rect.top + dest_rect.top - dest[1], *dest_rect.size)
+        
+        if rect.width and rect.height:
+            region = self.tiles[self.layer_index(layer_id), rect.top:rect.bottom, rect.left:rect.right].copy()
+            self.tiles[self.layer_index(dest_layer_id), dest_rect.top:dest_rect.bottom, dest_rect.left:dest_rect.right] = region
+            self.update_region(dest_layer_id, dest_rect)
+    
+    def get_chunk_data(self: Self, chunk_x: int, chunk_y: int) -> tuple[np.ndarray, np.ndarray]:
+        # We give tiles and masks of all layers of a chunk
+        chunk_size = cts.chunk_size
+        left, top = chunk_x*chunk_size, chunk_y*chunk_size
+        if not self.streaming:
+            return self.tiles[:, top:top+chunk_size, left:left+chunk_size], self.masks[:, top:top+chunk_size, left:left+chunk_size]
+        
+        # Streamed chunks are loaded on first use and marked as the most recently used
+        data = self.resident.get((chunk_x, chunk_y))
+        if data is None:
+            data = self.load_chunk(chunk_x, chunk_y)
+        else:
+            self.resident.move_to_end((chunk_x, chunk_y))
+        return data
+    
+    def load_chunk(self: Self, chunk_x: int, chunk_y: int) -> tuple[np.ndarray, np.ndarray]:
+        chunk_size = cts.chunk_size
+        left, top = chunk_x*chunk_size, chunk_y*chunk_size
+        width, height = min(chunk_size, self.size[0] - left), min(chunk_size, self.size[1] - top)
+        
+        # Masks need the tiles around the chunk too
+        area = Rect(left-1, top-1, width+2, height+2).clip(Rect(0, 0, *self.size))
+        region = np.stack([self.map_file.read_region(index, *area) for index in range(len(self.tilemap))]) # type: ignore
+        masks = np.stack([get_masks(layer, left-area.x, top-area.y, width, height) for layer in region])
+        tiles = region[:, top-area.y:top-area.y+height, left-area.x:left-area.x+width].copy()
+        self.resident[(chunk_x, chunk_y)] = (tiles, masks)
+        
+        # Then we index its animated cells
+        for index, layer in enumerate(tiles):
+            cells_y, cells_x = np.nonzero(self.tileset.animated[layer])
+            if len(cells_x):
+                self.animated[(self.layer_id_range[0] + index, chunk_x, chunk_y)] = list(zip((cells_x + left).tolist(), (cells_y + top).tolist()))
+        return tiles, masks
+    
+    def evict_chunk(self: Self, chunk_x: int, chunk_y: int) -> None:
+        self.resident.pop((chunk_x, chunk_y), None)
+        for layer_id in self.tilemap:
+            self.chunks.pop((layer_id, chunk_x, chunk_y), None)
+            self.chunks_frames.pop((layer_id, chunk_x, chunk_y), None)
+            self.animated.pop((layer_id, chunk_x, chunk_y), None)
+            
+    def stream(self: Self, view: Rect) -> None:
+        # Chunks within the radius of the view are loaded
+        chunk_pixels = cts.chunk_size*self.tileset.tile_size
+        radius = cts.stream_radius
+        chunks = Rect(view.left//chunk_pixels - radius, view.top//chunk_pixels - radius, 0, 0)
+        chunks.size = ((view.right-1)//chunk_pixels + radius + 1 - chunks.left, (view.bottom-1)//chunk_pixels + radius + 1 - chunks.top)
+        chunks = chunks.clip(Rect(0, 0, (self.size[0]-1)//cts.chunk_size + 1, (self.size[1]-1)//cts.chunk_size + 1))
+        for chunk_y in range(chunks.top, chunks.bottom):
+            for chunk_x in range(chunks.left, chunks.right):
+                self.get_chunk_data(chunk_x, chunk_y)
+        
+        # Then least recently used chunks are evicted, those around the view were just used so they stay
+        while len(self.resident) > chunks.width*chunks.height + cts.stream_cache:
+            self.evict_chunk(*next(iter(self.resident)))
+    
+    def bake_chunk(self: Self, layer_id: int, chunk_x: int, chunk_y: int) -> Surface:
+        chunk_size = cts.chunk_size
+        tile_size = self.tileset.tile_size
+        index = self.layer_index(layer_id)
+        tiles, masks = self.get_chunk_data(chunk_x, chunk_y)
+        tile_ids, masks = tiles[index].tolist(), masks[index].tolist()
+        self.acquire_pages(self.tileset.get_files(tiles[index]))
+        
+        surface = Surface((chunk_size*tile_size, chunk_size*tile_size), cts.flags)
+        surface.fill((0, 0, 0, 0))
+        
+        for y, row in enumerate(tile_ids):
+            for x, tile_id in enumerate(row):
+                if tile_id != -1:
+                    surface.blit(self.tileset.tiles[tile_id].get_tile(masks[y][x]), (x*tile_size, y*tile_size))
+        
+        # We remember which frame each animated cell shows
+        key = (layer_id, chunk_x, chunk_y)
+        self.chunks[key] = surface
+        self.chunks_frames[key] = [self.get_tile(layer_id, x, y).get_frame() for x, y in self.animated.get(key, [])] # type: ignore
+        return surface
+    
+    def animate_chunk(self: Self, layer_id: int, chunk_x: int, chunk_y: int) -> None:
+        key = (layer_id, chunk_x, chunk_y)
+        chunk = self.chunks[key]
+        frames = self.chunks_frames[key]
+        tile_size = self.tileset.tile_size
+        
+        # Only animated cells whose frame changed are composed again
+        for i, (tile_x, tile_y) in enumerate(self.animated.get(key, [])):
+            tile_obj: Tile = self.get_tile(layer_id, tile_x, tile_y) # type: ignore
+            frame = tile_obj.get_frame()
+            if frame != frames[i]:
+                frames[i] = frame
+                pos = ((tile_x - chunk_x*cts.chunk_size)*tile_size, (tile_y - chunk_y*cts.chunk_size)*tile_size)
+                chunk.fill((0, 0, 0, 0), Rect(pos, (tile_size, tile_size)))
+                chunk.blit(tile_obj.get_tile(self.get_mask(layer_id, tile_x, tile_y), frame), pos)
+                self.mark_redraw(layer_id, Rect(tile_x*tile_size, tile_y*tile_size, tile_size, tile_size))
+    
+    def get_chunk(self: Self, layer_id: int, chunk_x: int, chunk_y: int) -> Surface:
+        chunk = self.chunks.get((layer_id, chunk_x, chunk_y))
+        if chunk is None:
+            chunk = self.bake_chunk(layer_id, chunk_x, chunk_y)
+        return chunk
+            
+    def get_chunks(self: Self, rect: Rect) -> list[tuple[int, int]]:
+        # We give the chunks inside the map touching a pixel rect
+        chunk_pixels = cts.chunk_size*self.tileset.tile_size
+        rect = rect.clip(Rect((0, 0), self.get_pixel_size()))
+        if not (rect.width and rect.height):
+            return []
+        return [
+            (chunk_x, chunk_y) for chunk_y in range(rect.top//chunk_pixels, (rect.bottom-1)//chunk_pixels + 1)
+            for chunk_x in range(rect.left//chunk_pixels, (rect.right-1)//chunk_pixels + 1)
+        ]
+    
+    def draw_region(self: Self, map_view: MapView, view: Rect, region: Rect) -> None:
+        # We clear the region of the view and draw the chunks parts inside it layer by layer
+        region = region.clip(view)
+        map_view.surface.fill((0, 0, 0, 0), region.move(-view.x, -view.y)) # type: ignore
+        chunk_pixels = cts.chunk_size*self.tileset.tile_size
+        
+        for layer_id in map_view.layer_ids:
+            for chunk_x, chunk_y in self.get_chunks(region):
+                chunk_rect = Rect(chunk_x*chunk_pixels, chunk_y*chunk_pixels, chunk_pixels, chunk_pixels)
+                area = region.clip(chunk_rect)
+                chunk = self.get_chunk(layer_id, chunk_x, chunk_y)
+                map_view.surface.blit(chunk, (area.x - view.x, area.y - view.y), area.move(-chunk_rect.x, -chunk_rect.y)) # type: ignore
+    
+    def render_views(self: Self, camera: Camera, groups: dict[Any, list[int]]) -> dict[Any, Surface]:
+        view = camera.get_rect()
+        chunks = self.get_chunks(view)
+        if self.streaming:
+            self.stream(view)
+        
+        # First visible animated cells move to their current frame, marking their views
+        for name, layer_ids in groups.items():
+            if name not in self.views or self.views[name].layer_ids != layer_ids:
+                self.views[name] = MapView(layer_ids)
+        for layer_id in {layer_id for layer_ids in groups.values() for layer_id in layer_ids}:
+            for chunk_x, chunk_y in chunks:
+                if (layer_id, chunk_x, chunk_y) in self.chunks:
+                    self.animate_chunk(layer_id, chunk_x, chunk_y)
+        
+        # Then each view only draws what changed or got exposed since its last render
+        self.dirty_rects = []
+        for name in groups:
+            map_view = self.views[name]
+            moved = map_view.view != view
+            for region in map_view.get_regions(view):
+                if region.colliderect(view):
+                    self.draw_region(map_view, view, region)
+                    self.dirty_rects.append(region.clip(view).move(-view.x, -view.y))
+            map_view.view = view
+            
+            # A moving camera changes the whole screen
+            if moved:
+                self.dirty_rects = [Rect((0, 0), view.size)]
+        
+        return {name: self.views[name].surface for name in groups} # type: ignore
+            
+    def render_layers(self: Self, camera: Camera) -> dict[int, Surface]:
+        return self.render_views(camera, {layer_id: [layer_id] for layer_id in range(*self.layer_id_range)})
+    
+    def render_composites(self: Self, camera: Camera) -> tuple[Surface, Surface]:
+        # Layers up to the actor layer are flattened under actors, the others over them
+        layer_ids = list(range(*self.layer_id_range))
+        views = self.render_views(camera, {
+            "below": [layer_id for layer_id in layer_ids if layer_id <= cts.actor_layer],
+            "above": [layer_id for layer_id in layer_ids if layer_id > cts.actor_layer]
+        })
+        return views["below"], views["above"]
@@ -0,0 +1,209 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self, Any
+from struct import Struct
+from mmap import mmap, ACCESS_READ
+from zlib import compress, decompress
+from json import load as jsload, dump as jsdump, loads, dumps
+from os.path import join, exists, getmtime, splitext
+from sys import argv
+import numpy as np
+
+# Import game components
+from .constants import MAP as cts
+
+# Create constants of the module
+MAGIC: bytes = b"RSMP"
+VERSION: int = 1
+COMPRESSED: int = 1
+HEADER: Struct = Struct("<4sHHI")
+CHUNK_ENTRY: np.dtype = np.dtype([("offset", "<u8"), ("length", "<u4")])
+TILE_TYPE: np.dtype = np.dtype("<i2")
+
+
+# Create helper functions of the module
+def align(offset: int) -> int:
+    # Tile planes start on 16 bytes boundaries
+    return (offset + 15) // 16 * 16
+
+
+def get_path(name: str) -> str:
+    # We pick the binary map unless the json one has been saved after it
+    json_path = join(cts.map_folder, f"{name}.json")
+    binary_path = join(cts.map_folder, f"{name}{cts.binary_extension}")
+    if exists(binary_path) and (not exists(json_path) or getmtime(binary_path) >= getmtime(json_path)):
+        return binary_path
+    return json_path
+
+
+def read_json(path: str) -> tuple[dict[str, Any], np.ndarray]:
+    with open(path, "r") as file:
+        meta = jsload(file)
+
+    # Layers missing from the file are empty
+    layers = meta.pop("layers")
+    tiles = np.full((meta["layer_id_range"][-1] - meta["layer_id_range"][0], meta["size"][1], meta["size"][0]), -1, np.int16)
+    for layer in layers:
+        tiles[layer["id"] - meta["layer_id_range"][0]] = layer["tiles"]
+    return meta, tiles
+
+
+def write_json(path: str, meta: dict[str, Any], tiles: np.ndarray) -> None:
+    data = dict(meta)
+    data["layers"] = [{"id": meta["layer_id_range"][0] + i, "tiles": layer.tolist()} for i, layer in enumerate(tiles)]
+    with open(path, "w") as file:
+        jsdump(data, file)
+
+
+def write_binary(path: str, meta: dict[str, Any], tiles: np.ndarray, compressed: bool=False) -> None:
+    meta = dict(meta, chunk_size=cts.chunk_size)
+    meta_data = dumps(meta).encode("utf-8")
+    offset = align(HEADER.size + len(meta_data))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, COMPRESSED if compressed else 0, len(meta_data)))
+        file.write(meta_data)
+        file.write(bytes(offset - file.tell()))
+
+        if not compressed:
+            # Raw planes of shape (layers, height, width)
+            file.write(tiles.astype(TILE_TYPE).tobytes())
+            return
+
+        # Compressed maps start with a table giving where each chunk is stored
+        chunk_size = meta["chunk_size"]
+        chunks_y, chunks_x = (tiles.shape[1]-1)//chunk_size + 1, (tiles.shape[2]-1)//chunk_size + 1
+        table = np.zeros((tiles.shape[0], chunks_y, chunks_x), CHUNK_ENTRY)
+        position = offset + table.nbytes
+        chunks = []
+        for index in range(tiles.shape[0]):
+            for chunk_y in range(chunks_y):
+                for chunk_x in range(chunks_x):
+                    chunk = tiles[index, chunk_y*chunk_size:(chunk_y+1)*chunk_size, chunk_x*chunk_size:(chunk_x+1)*chunk_size]
+                    data = compress(np.ascontiguousarray(chunk, TILE_TYPE).tobytes())
+                    table[index, chunk_y, chunk_x] = (position, len(data))
+                    position += len(data)
+                    chunks.append(data)
+        file.write(table.tobytes())
+        for data in chunks:
+            file.write(data)
+
+
+# Create the MapFile object
+class MapFile:
+    """
+    Binary map file opened through a memory map
+
+    The file is a header, the map infos as json, then either raw int16
+    tile planes of shape (layers, height, width), or a chunk table followed
+    by each chunk of each layer compressed on its own
+    """
+    def __init__(self: Self, path: str) -> None:
+        self.path: str = path
+        with open(path, "rb") as file:
+            magic, version, self.flags, meta_length = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} binary map")
+            self.meta: dict[str, Any] = loads(file.read(meta_length).decode("utf-8"))
+
+        self.offset: int = align(HEADER.size + meta_length)
+        self.chunk_size: int = self.meta["chunk_size"]
+        self.shape: tuple[int, int, int] = (
+            self.meta["layer_id_range"][-1] - self.meta["layer_id_range"][0], self.meta["size"][1], self.meta["size"][0]
+        )
+        self.compressed: bool = bool(self.flags & COMPRESSED)
+        self.table: np.ndarray | None = None
+        self.data: mmap | None = None
+        self.planes: np.ndarray | None = None
+        if not self.compressed:
+            self.planes = np.memmap(path, TILE_TYPE, "r", self.offset, self.shape)
+        else:
+            chunks_shape = (self.shape[0], (self.shape[1]-1)//self.chunk_size + 1, (self.shape[2]-1)//self.chunk_size + 1)
+            self.table = np.memmap(path, CHUNK_ENTRY, "r", self.offset, chunks_shape)
+            with open(path, "rb") as file:
+                self.data = mmap(file.fileno(), 0, access=ACCESS_READ)
+
+    def read_tiles(self: Self) -> np.ndarray:
+        if not self.compressed:
+            # Pages are only read when touched, and edits stay in memory
+            return np.memmap(self.path, TILE_TYPE, "c", self.offset, self.shape)
+
+        tiles = np.empty(self.shape, np.int16)
+        for index in range(self.shape[0]):
+            for chunk_y in range(self.table.shape[1]): # type: ignore
+                for chunk_x in range(self.table.shape[2]): # type: ignore
+                    top, left = chunk_y*self.chunk_size, chunk_x*self.chunk_size
+                    tiles[index, top:top+self.chunk_size, left:left+self.chunk_size] = self.read_chunk(index, chunk_x, chunk_y)
+        return tiles
+
+    def read_chunk(self: Self, index: int, chunk_x: int, chunk_y: int) -> np.ndarray:
+        top, left = chunk_y*self.chunk_size, chunk_x*self.chunk_size
+        height, width = min(self.chunk_size, self.shape[1] - top), min(self.chunk_size, self.shape[2] - left)
+        if not self.compressed:
+            return np.array(self.planes[index, top:top+height, left:left+width], np.int16) # type: ignore
+
+        offset, length = self.table[index, chunk_y, chunk_x] # type: ignore
+        data = decompress(self.data[int(offset):int(offset)+int(length)]) # type: ignore
+        return np.frombuffer(data, TILE_TYPE).reshape(height, width).astype(np.int16)
+
+    def read_region(self: Self, index: int, x: int, y: int, width: int, height: int) -> np.ndarray:
+        if not self.compressed:
+            return np.array(self.planes[index, y:y+height, x:x+width], np.int16) # type: ignore
+
+        # We gather the region from every chunk it overlaps
+        region = np.empty((height, width), np.int16)
+        for chunk_y in range(y//self.chunk_size, (y+height-1)//self.chunk_size + 1):
+            for chunk_x in range(x//self.chunk_size, (x+width-1)//self.chunk_size + 1):
+                chunk = self.read_chunk(index, chunk_x, chunk_y)
+                top, left = chunk_y*self.chunk_size, chunk_x*self.chunk_size
+                y0, x0 = max(y, top), max(x, left)
+                y1, x1 = min(y+height, top+chunk.shape[0]), min(x+width, left+chunk.shape[1])
+                region[y0-y:y1-y, x0-x:x1-x] = chunk[y0-top:y1-top, x0-left:x1-left]
+        return region
+
+    def close(self: Self) -> None:
+        self.planes = None
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+# Create the map loading functions
+def read_map(name: str) -> tuple[dict[str, Any], np.ndarray]:
+    return read_file(get_path(name))
+
+
+def read_file(path: str) -> tuple[dict[str, Any], np.ndarray]:
+    if path.endswith(".json"):
+        return read_json(path)
+
+    map_file = MapFile(path)
+    tiles = map_file.read_tiles()
+    map_file.close()
+    return map_file.meta, tiles
+
+
+def convert(name: str, compressed: bool=False, to_json: bool=False) -> str:
+    # Converts a map of the maps folder from one format to the other
+    if to_json:
+        map_file = MapFile(join(cts.map_folder, f"{name}{cts.binary_extension}"))
+        meta, tiles = map_file.meta, map_file.read_tiles()
+        map_file.close()
+        meta.pop("chunk_size", None)
+        path = join(cts.map_folder, f"{name}.json")
+        write_json(path, meta, tiles)
+    else:
+        meta, tiles = read_json(join(cts.map_folder, f"{name}.json"))
+        path = join(cts.map_folder, f"{name}{cts.binary_extension}")
+        write_binary(path, meta, tiles, compressed)
+    return path
+
+
+# Launching the converter
+if __name__ == "__main__":
+    # python -m libs.MapFile [--json] [--compress] name [name ...]
+    names = [arg for arg in argv[1:] if not arg.startswith("--")]
+    for name in names:
+        name = splitext(name)[0]
+        print(convert(name, compressed="--compress" in argv, to_json="--json" in argv))
@@ -0,0 +1,87 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self, Any
+from concurrent.futures import ThreadPoolExecutor, Future
+from os.path import join, exists, getmtime
+from pygame import Surface
+
+# Import game components
+from .constants import MAP as cts
+from .Resource import resources
+from . import MapFile
+from .Map import Tileset
+
+
+# Create helper functions of the module
+def read_map(name: str) -> tuple[tuple[str, float], tuple[dict[str, Any], Any], Tileset, dict[str, tuple[Surface, Any]]]:
+    # Runs in a worker, files are read and pages decoded, or baked when the atlas cache is cold, but nothing touches the display
+    path = MapFile.get_path(name)
+    key = (path, getmtime(path))
+    meta, tiles = MapFile.read_file(path)
+    tileset = Tileset(meta["tileset"])
+    # Pages already in the resource manager are not read again
+    pages = {filename: tileset.decode_page(filename) for filename in tileset.get_files(tiles) if tileset.get_source_path(filename) not in resources}
+    return key, (meta, tiles), tileset, pages
+
+
+def store(key: Any, value: Any, on_evict: Any=None) -> Any:
+    # Prefetched assets are cached without being used, so they can be evicted like any other
+    value = resources.acquire(key, lambda: value, on_evict)
+    resources.release(key)
+    return value
+
+
+# Create the Prefetcher object
+class Prefetcher:
+    """
+    This object loads maps in the background before they are needed
+
+    Workers read the map data and decode the atlas pages it uses, then
+    poll converts them on the main thread one page per call and hands
+    them to the resource manager, so loading a prefetched map does not
+    read any file
+    """
+    def __init__(self: Self, workers: int=cts.prefetch_workers) -> None:
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(workers, "prefetch")
+        self.jobs: dict[str, Future] = {}
+        self.pages: list[tuple[str, str, tuple[Surface, Any]]] = []
+
+    def prefetch(self: Self, names: list[str], cancel: bool=True) -> None:
+        # Jobs of maps we can no longer reach are dropped if they did not start yet
+        for name in list(self.jobs) if cancel else []:
+            if name not in names and self.jobs[name].cancel():
+                del self.jobs[name]
+
+        for name in names:
+            # Missing maps are skipped, they will raise when they are really needed
+            path = MapFile.get_path(name)
+            if name in self.jobs or not exists(path) or (path, getmtime(path)) in resources:
+                continue
+            self.jobs[name] = self.executor.submit(read_map, name)
+
+    def is_pending(self: Self, names: list[str]) -> bool:
+        # Maps stay pending until poll handed them and all of their pages to the resource manager
+        return any(name in self.jobs for name in names) or any(page[0] in names for page in self.pages)
+
+    def poll(self: Self) -> None:
+        # We only convert one page per call to spread the conversions over frames
+        if self.pages:
+            _, key, page = self.pages.pop()
+            # The page may have been loaded since the worker read it, it is only converted when missing
+            if key not in resources:
+                store(key, (page[0].convert_alpha(), page[1]))
+            return
+        
+        name = next((name for name, job in self.jobs.items() if job.done()), None)
+        if name is None:
+            return
+        job = self.jobs.pop(name)
+        if job.cancelled() or job.exception() is not None:
+            # The map will be loaded again, and raise, when it is really needed
+            return
+
+        key, data, tileset, pages = job.result()
+        store(key, data)
+        tileset = store(join(cts.tileset_folder, f"{tileset.name}.json"), tileset, Tileset.release)
+        self.pages = [(name, tileset.get_source_path(filename), page) for filename, page in pages.items()]
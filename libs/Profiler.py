@@ -0,0 +1,130 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self
+from time import perf_counter_ns
+from os import makedirs
+from os.path import join
+from json import dump
+from pygame import Surface, Rect
+import numpy as np
+
+# Import game components
+from .constants import PROFILER as cts
+from .Text import text_cache
+
+
+# Create the FrameProfiler object
+class FrameProfiler:
+    """
+    This object times each phase of the frames of the game loop
+
+    The last frames are kept in a ring buffer of fixed size, phases are
+    closed with mark in the order they run and a frame ends with end_frame
+    """
+    def __init__(self: Self, phases: list[str], capacity: int=cts.capacity) -> None:
+        self.phases: list[str] = phases
+        self.capacity: int = capacity
+        self.times: np.ndarray = np.zeros((capacity, len(phases)), np.float64)
+        self.starts: np.ndarray = np.zeros(capacity, np.int64)
+        self.index: int = 0
+        self.count: int = 0
+        self.last_mark: int = perf_counter_ns()
+        self.origin: int = self.last_mark
+        self.overlay: bool = False
+        self.overlay_surface: Surface | None = None
+        self.overlay_rect: Rect = Rect(cts.overlay_position, (0, 0))
+
+    def start_frame(self: Self) -> None:
+        self.last_mark = perf_counter_ns()
+        self.starts[self.index] = self.last_mark
+        self.times[self.index] = 0
+
+    def mark(self: Self, phase: str) -> None:
+        now = perf_counter_ns()
+        self.times[self.index, self.phases.index(phase)] += (now - self.last_mark) / 1e6
+        self.last_mark = now
+
+    def end_frame(self: Self) -> None:
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        if self.overlay and not self.index % cts.overlay_refresh:
+            self.overlay_surface = None
+
+    def get_frames(self: Self) -> np.ndarray:
+        # Recorded frames from the oldest to the newest
+        order = (np.arange(self.count) + self.index - self.count) % self.capacity
+        return self.times[order]
+
+    def get_stats(self: Self) -> dict[str, dict[str, float]]:
+        frames = self.get_frames()
+        if not len(frames):
+            return {}
+        columns = {phase: frames[:, i] for i, phase in enumerate(self.phases)}
+        # The frame is only the work done, waiting in the clock is not part of the budget
+        columns["frame"] = frames[:, [i for i, phase in enumerate(self.phases) if phase not in cts.idle_phases]].sum(axis=1)
+        return {
+            name: {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)), "p99": float(np.percentile(values, 99)), "max": float(values.max())}
+            for name, values in columns.items()
+        }
+
+    def get_worst(self: Self, number: int=5) -> list[dict[str, float]]:
+        # Slowest frames with the time of each of their phases, the slowest first
+        frames = self.get_frames()
+        work = frames[:, [i for i, phase in enumerate(self.phases) if phase not in cts.idle_phases]].sum(axis=1)
+        return [
+            dict(zip(self.phases, frames[i].tolist()), frame=float(work[i]), age=int(len(frames) - 1 - i))
+            for i in np.argsort(work)[::-1][:number]
+        ]
+
+    def dump_trace(self: Self, path: str | None=None) -> str:
+        # Frames are written as complete events of the chrome trace format, times in microseconds
+        if path is None:
+            makedirs(cts.trace_folder, exist_ok=True)
+            path = join(cts.trace_folder, f"trace_{perf_counter_ns() // 1000000}.json")
+        order = (np.arange(self.count) + self.index - self.count) % self.capacity
+        events = []
+        for i in order:
+            start = (int(self.starts[i]) - self.origin) / 1000
+            events.append({"name": "frame", "ph": "X", "pid": 0, "tid": 0, "ts": start, "dur": float(self.times[i].sum())*1000})
+            for phase, duration in zip(self.phases, self.times[i].tolist()):
+                events.append({"name": phase, "ph": "X", "pid": 0, "tid": 0, "ts": start, "dur": duration*1000})
+                start += duration*1000
+        with open(path, "w") as file:
+            dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        return path
+
+    def toggle_overlay(self: Self) -> Rect:
+        # The returned rect has to be drawn again, to show or to erase the overlay
+        self.overlay = not self.overlay
+        self.overlay_surface = None
+        return self.get_dirty_rect() if self.overlay else self.overlay_rect.copy()
+    
+    def get_dirty_rect(self: Self) -> Rect:
+        # The scene is drawn again under the overlay, which can change size when rendered again
+        rect = self.overlay_rect.copy()
+        self.get_overlay()
+        return rect.union(self.overlay_rect)
+
+    def get_overlay(self: Self) -> Surface:
+        # The overlay is only rendered again every few frames
+        if self.overlay_surface is None:
+            # Numbers change at each refresh, so only the font is shared
+            font = text_cache.get_font(cts.font_size)
+            stats = self.get_stats()
+            lines = [f"{'phase':<8}{'p50':>7}{'p95':>7}{'max':>7}"]
+            lines += [f"{name:<8}{values['p50']:>7.2f}{values['p95']:>7.2f}{values['max']:>7.2f}" for name, values in stats.items()]
+            worst = self.get_worst(1)
+            if worst and worst[0]["frame"] > cts.budget:
+                phase = max(self.phases, key=lambda phase: worst[0][phase] if phase not in cts.idle_phases else -1)
+                lines.append(f"worst {worst[0]['frame']:.1f}ms in {phase}")
+            texts = [font.render(line, True, (255, 255, 255)) for line in lines]
+            self.overlay_surface = Surface((max(text.get_width() for text in texts) + 8, len(texts)*cts.font_size + 8), cts.flags)
+            self.overlay_surface.fill((0, 0, 0, 160))
+            for i, text in enumerate(texts):
+                self.overlay_surface.blit(text, (4, 4 + i*cts.font_size))
+            self.overlay_rect = self.overlay_surface.get_rect(topleft=cts.overlay_position)
+        return self.overlay_surface
+
+    def draw(self: Self, surface: Surface) -> None:
+        surface.blit(self.get_overlay(), self.overlay_rect)
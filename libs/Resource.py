@@ -0,0 +1,107 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self, Any, Callable
+from collections import OrderedDict
+from pygame import Surface
+from pygame.mixer import Sound, get_init
+import numpy as np
+
+# Import game components
+from .constants import RESOURCE as cts
+
+
+# Create helper functions of the module
+def get_size(value: Any) -> int:
+    # Size in bytes of the decoded data of an asset, unknown objects count for nothing
+    if isinstance(value, Surface):
+        return value.get_pitch() * value.get_height()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Sound):
+        frequency, size, channels = get_init() or (0, 0, 0)
+        return int(value.get_length() * frequency * channels * (abs(size)//8))
+    if isinstance(value, (tuple, list)):
+        return sum(get_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(get_size(item) for item in value.values())
+    return 0
+
+
+# Create the Resource object
+class Resource:
+    """
+    Entry of a loaded asset in the resource manager
+    """
+    def __init__(self: Self, value: Any, on_evict: Callable[[Any], None] | None=None) -> None:
+        self.value: Any = value
+        self.size: int = get_size(value)
+        self.references: int = 0
+        self.on_evict: Callable[[Any], None] | None = on_evict
+
+
+# Create the ResourceManager object
+class ResourceManager:
+    """
+    This object shares loaded assets by path
+
+    Assets are counted each time they are acquired, once nobody uses them
+    they stay cached until the budget is exceeded, least recently used first
+    """
+    def __init__(self: Self, budget: int=cts.budget) -> None:
+        self.budget: int = budget
+        self.resources: OrderedDict[Any, Resource] = OrderedDict()
+        self.used: int = 0
+
+    def __contains__(self: Self, key: Any) -> bool:
+        return key in self.resources
+
+    def acquire(self: Self, key: Any, loader: Callable[[], Any], on_evict: Callable[[Any], None] | None=None) -> Any:
+        resource = self.resources.get(key)
+        if resource is None:
+            resource = Resource(loader(), on_evict)
+            self.resources[key] = resource
+            self.used += resource.size
+        resource.references += 1
+        self.resources.move_to_end(key)
+        self.evict()
+        return resource.value
+
+    def release(self: Self, key: Any) -> None:
+        resource = self.resources.get(key)
+        if resource is None or not resource.references:
+            return
+        resource.references -= 1
+        if not resource.references:
+            self.evict()
+
+    def remove(self: Self, key: Any) -> None:
+        resource = self.resources.pop(key)
+        self.used -= resource.size
+        if resource.on_evict is not None:
+            resource.on_evict(resource.value)
+
+    def evict(self: Self, budget: int | None=None) -> None:
+        budget = self.budget if budget is None else budget
+
+        # Evicting an asset can release the ones it used, so we look again after each eviction
+        while self.used > budget:
+            key = next((key for key, resource in self.resources.items() if not resource.references), None)
+            if key is None:
+                return
+            self.remove(key)
+
+    def clear(self: Self) -> None:
+        # Every unused asset is dropped whatever the budget
+        self.evict(-1)
+
+    def get_infos(self: Self) -> dict[str, int]:
+        return {
+            "resources": len(self.resources),
+            "referenced": sum(bool(resource.references) for resource in self.resources.values()),
+            "used": self.used,
+            "budget": self.budget
+        }
+
+
+resources: ResourceManager = ResourceManager()
@@ -3,11 +3,13 @@
 # Import built-in modules
 from typing import Self, Any
 from pygame import Rect, Surface
-from pygame.font import SysFont as font
 
 # Import game components
 from .constants import SCENE as cts
 from . import Map
+from .Prefetch import Prefetcher
+from .Text import text_cache
+from .Camera import Camera
 from .Transition import FadeIn, FadeOut
 
 
@@ -16,6 +18,9 @@ class BaseScene:
     """
     Base instance of all scenes of the game
     """
+    # Maps loaded when the scene is built, the engine prefetches them before preloading it
+    maps: list[str] = []
+    
     def __init__(self: Self, game_engine: Any) -> None:
         self.game_engine: Any = game_engine
         self.surface: Surface = Surface(cts.size, cts.flags)
@@ -23,13 +28,19 @@ class BaseScene:
     def reinit(self: Self) -> None:
         raise NotImplementedError
     
-    def update(self: Self) -> list[Rect] | None:
+    def update(self: Self) -> None:
         if self.game_engine.event_manager.get_event("Quit"):
             self.game_engine.quit()
+            
+    def interpolate(self: Self, alpha: float) -> None:
+        # Scenes moving things smoothly draw them between their last two updates here
+        pass
     
-    def render(self: Self) -> None:
-        self.game_engine.screen.fill((255, 255, 255))
-        self.game_engine.screen.blit(self.surface, (0, 0))
+    def render(self: Self, rects: list[Rect] | None=None) -> None:
+        # Without rects the whole scene is rendered
+        for rect in rects if rects is not None else [self.surface.get_rect()]:
+            self.game_engine.screen.fill((255, 255, 255), rect)
+            self.game_engine.screen.blit(self.surface, rect, rect)
  
    
 # Create TitleScreen
@@ -42,71 +53,55 @@ class TitleScreen(BaseScene):
         BaseScene.__init__(self, game_engine)
         self.choices: list[str] = ["Nouvelle Partie", "Continuer", "Options", "Quitter"]
         self.scenes: list[str | None] = ["NewGame", "LoadGame", "Options", None]
-        self.title_font = font(None, 48)
-        self.text_font = font(None, 32)
+        
+        # Texts never change so they are rendered once
+        self.title: Surface = text_cache.render("Runes of Sophia", 48, (0, 0, 0))
+        self.texts: list[Surface] = [text_cache.render(choice, 32, (0, 0, 0)) for choice in self.choices]
+        self.highlight: Surface = Surface((cts.size[0]//2, 48), cts.flags)
+        self.highlight.fill((155, 255, 55))
+        self.menu_rect: Rect = Rect(cts.size[0]//4, cts.size[1]//2, cts.size[0]//2, 48*len(self.choices))
         
         # Now we initialize changing attributes
         self.current_choice: int = 0
-        self.lock_cursor: bool = False
+        
+        # Finally we draw the scene
+        self.surface.fill((255, 255, 255))
+        self.surface.blit(self.title, self.title.get_rect(center=(cts.size[0]//2, cts.size[1]//4)))
+        self.draw_menu()
         
     def reinit(self: Self) -> None:
         self.current_choice = 0
-        self.lock_cursor = False
+        self.draw_menu()
+        
+    def draw_menu(self: Self) -> None:
+        self.surface.fill((255, 255, 255), self.menu_rect)
+        for i, txt in enumerate(self.texts):
+            if self.current_choice == i:
+                self.surface.blit(self.highlight, (self.menu_rect.x, self.menu_rect.y + i*48))
+            self.surface.blit(txt, txt.get_rect(center=(cts.size[0]//2, cts.size[1]//2 + 24 + i*48)))
     
-    def update(self: Self) -> list[Rect]:
+    def update(self: Self) -> None:
         BaseScene.update(self)
-        # get events and make updates of it
-        if self.game_engine.event_manager.get_event("Release"):
-            self.lock_cursor = False
-            self.game_engine.event_manager.kill_timer("UnlockCursor")
-            
-        if self.game_engine.event_manager.get_event("Pressed") and not self.lock_cursor:
-            self.game_engine.event_manager.add_timer("UnlockCursor", 250, repeat=True)
-            
-        if self.game_engine.event_manager.get_event("UnlockCursor"):
-            self.lock_cursor = False
-            
-        if self.game_engine.event_manager.get_event("MoveUp") and not self.lock_cursor:
-            self.lock_cursor = True
+        previous_choice = self.current_choice
+        
+        # The cursor moves when a direction is pressed, then repeats while it is held
+        event_manager = self.game_engine.event_manager
+        if event_manager.get_repeat("MoveUp"):
             self.current_choice = (self.current_choice - 1) % 4
             
-        if self.game_engine.event_manager.get_event("MoveDown") and not self.lock_cursor:
-            self.lock_cursor = True
+        if event_manager.get_repeat("MoveDown"):
             self.current_choice = (self.current_choice + 1) % 4
         
-        if self.game_engine.event_manager.get_event("Action") and not self.lock_cursor:
-            if not self.current_choice == 3:
-                transition = FadeOut(1000)
-                transition.play(self)
-            self.game_engine.change_scene(self.scenes[self.current_choice], enter_transition=FadeIn(1000))
-            return [Rect(0, 0, *cts.size)]
+        if event_manager.is_pressed("Action"):
+            # Quitting does not fade out
+            exit_transition = FadeOut(1000) if self.current_choice != 3 else None
+            self.game_engine.change_scene(self.scenes[self.current_choice], enter_transition=FadeIn(1000), exit_transition=exit_transition)
+            return
             
-        # make changes to the surface and storing updated rects
-        modified_rects: list[Rect] = []
-        blits: list[tuple[Surface, Rect]] = []
-        title: Surface = self.title_font.render("Runes of Sophia", True, (0, 0, 0))
-        title_rect: Rect = title.get_rect(center=(cts.size[0]//2, cts.size[1]//4))
-        modified_rects.append(title_rect)
-        blits.append((title, title_rect))
-
-        for i, choice in enumerate(self.choices):
-            if self.current_choice == i:
-                surf: Surface = Surface((cts.size[0]//2, 48), cts.flags)
-                surf.fill((155, 255, 55))
-                surf_rect: Rect = Rect(cts.size[0]//4, cts.size[1]//2 + i*48, cts.size[0]//2, 48)
-                blits.append((surf, surf_rect))
-            txt: Surface = self.text_font.render(choice, True, (0, 0, 0))
-            txt_rect: Rect = txt.get_rect(center=(cts.size[0]//2, cts.size[1]//2 + 24 + i*48))
-            blits.append((txt, txt_rect))
-
-        modified_rects.append(Rect(cts.size[0]//4, cts.size[1]//2, cts.size[0]//2, 128))
-
-        # rendering the surface
-        self.surface.fill((255, 255, 255))
-        for blit, blit_rect in blits:
-            self.surface.blit(blit, blit_rect)
-
-        return modified_rects
+        # Only the menu is drawn again, and only when the choice changed
+        if self.current_choice != previous_choice:
+            self.draw_menu()
+            self.game_engine.dirty.mark(self.menu_rect)
 
 
 # Create Options scene
@@ -119,16 +114,15 @@ class Options(BaseScene):
     """
     def __init__(self: Self, game_engine: Any) -> None:
         BaseScene.__init__(self, game_engine)
+        self.surface.fill((0, 255, 255))
 
     def reinit(self: Self) -> None:
         pass
 
-    def update(self: Self) -> list[Rect]:
+    def update(self: Self) -> None:
         BaseScene.update(self)
-        if self.game_engine.event_manager.get_event("Cancel"):
+        if self.game_engine.event_manager.is_pressed("Cancel"):
             self.game_engine.change_scene("TitleScreen", reinit=False)
-        self.surface.fill((0, 255, 255))
-        return [Rect(0, 0, *cts.size)]
 
 
 # Create NewGame scene
@@ -140,16 +134,15 @@ class NewGame(BaseScene):
     """
     def __init__(self: Self, game_engine: Any) -> None:
         BaseScene.__init__(self, game_engine)
+        self.surface.fill((255, 0, 255))
 
     def reinit(self: Self) -> None:
         pass
 
-    def update(self: Self) -> list[Rect]:
+    def update(self: Self) -> None:
         BaseScene.update(self)
-        if self.game_engine.event_manager.get_event("Cancel"):
+        if self.game_engine.event_manager.is_pressed("Cancel"):
             self.game_engine.change_scene("TitleScreen", reinit=False)
-        self.surface.fill((255, 0, 255))
-        return [Rect(0, 0, *cts.size)]
 
 
 # Create LoadGame Scene
@@ -162,16 +155,15 @@ class LoadGame(BaseScene):
     """
     def __init__(self: Self, game_engine: Any) -> None:
         BaseScene.__init__(self, game_engine)
+        self.surface.fill((255, 255, 0))
 
     def reinit(self: Self) -> None:
         pass
 
-    def update(self: Self) -> list[Rect]:
+    def update(self: Self) -> None:
         BaseScene.update(self)
-        if self.game_engine.event_manager.get_event("Cancel"):
+        if self.game_engine.event_manager.is_pressed("Cancel"):
             self.game_engine.change_scene("TitleScreen", reinit=False)
-        self.surface.fill((255, 255, 0))
-        return [Rect(0, 0, *cts.size)]
 
 
 # Create OverWorld Scene
@@ -182,23 +174,67 @@ class OverWorld(BaseScene):
     Overworld is the scene where the player can walk
     on map and interact with various entities
     """
+    maps: list[str] = ["village"]
+    
     def __init__(self: Self, game_engine: Any) -> None:
         BaseScene.__init__(self, game_engine)
-        self.map = Map.Map("village")
+        # Maps are prefetched by the workers of the engine
+        self.prefetcher: Prefetcher = game_engine.prefetcher
+        self.map = Map.Map(self.maps[0])
+        self.map.load_pages()
+        self.camera: Camera
+        self.view: Camera
+        self.previous_position: tuple[int, int]
+        self.reset_camera()
+        self.prefetcher.prefetch(self.map.connections)
         self.frame = 0
         
+    def reset_camera(self: Self) -> None:
+        # The view is the camera as drawn, between its previous and current positions
+        self.camera = Camera(self.map.get_pixel_size())
+        self.view = Camera(self.map.get_pixel_size())
+        self.previous_position = self.camera.rect.topleft
+        
+    def load_map(self: Self, name: str) -> None:
+        # The previous map gives its tileset and data back, they stay cached while the budget allows it
+        self.map.unload()
+        self.map = Map.Map(name)
+        self.map.load_pages()
+        self.reset_camera()
+        self.surface.fill((0, 0, 0, 0))
+        
+        # Maps reachable from the new one are loaded in the background
+        self.prefetcher.prefetch(self.map.connections)
+        
     def reinit(self: Self) -> None:
         pass
     
-    def update(self: Self) -> list[Rect]:
+    def update(self: Self) -> None:
         BaseScene.update(self)
-        self.surface.fill((0, 0, 0, 0))
         
-        layers = self.map.render_layers((0, 0))
+        # We move the camera according to pressed directions
+        event_manager = self.game_engine.event_manager
+        dx = event_manager.get_event("MoveRight") - event_manager.get_event("MoveLeft")
+        dy = event_manager.get_event("MoveDown") - event_manager.get_event("MoveUp")
+        self.previous_position = self.camera.rect.topleft
+        self.camera.move(dx*self.camera.speed, dy*self.camera.speed)
         
-        for layer_id in range(*self.map.layer_id_range):
-            self.surface.blit(layers[layer_id], (0, 0))
+        # Maps prefetched in the background are handed to the resource manager
+        self.prefetcher.poll()
         
+        # Tile animations move forward once per update
+        Map.animation_clock.tick()
         self.frame += 1
         
-        return [Rect(0, 0, *cts.size)]
+    def interpolate(self: Self, alpha: float) -> None:
+        # The map is drawn with the camera between its last two positions
+        x, y = self.previous_position
+        self.view.move_to(round(x + (self.camera.rect.x - x)*alpha), round(y + (self.camera.rect.y - y)*alpha))
+        below, above = self.map.render_composites(self.view)
+        
+        # Only regions the map changed are composed again, actors will be drawn between both composites
+        for rect in self.map.dirty_rects:
+            self.surface.fill((0, 0, 0, 0), rect)
+            self.surface.blit(below, rect, rect)
+            self.surface.blit(above, rect, rect)
+            self.game_engine.dirty.mark(rect)
@@ -2,81 +2,255 @@
 
 # Import built-in modules
 from typing import Self
-from pygame.mixer_music import load, play, get_busy, set_volume
-from pygame.mixer import Sound
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from os.path import splitext, exists
+from pygame.mixer_music import load, play, queue, stop, fadeout, set_endevent, set_volume
+from pygame.mixer import Sound, Channel, get_init, set_num_channels, set_reserved
+from pygame.time import get_ticks
+
+# Import game components
+from .constants import EVENTS, SOUND as cts
+from .Resource import ResourceManager
+
+
+# Create helper functions of the module
+def read_file(path: str) -> bytes:
+    # Runs in a worker, musics are read before they are needed
+    with open(path, "rb") as file:
+        return file.read()
+
+
+# Create the Sfx object
+class Sfx:
+    """
+    Settings of a sound effect, its buffer is only decoded when it is played
+    """
+    def __init__(self: Self, path: str, group: str, priority: int, max_instances: int) -> None:
+        self.path: str = path
+        self.group: str = group
+        self.priority: int = priority
+        self.max_instances: int = max_instances
+
 
 # Create the Sound Manager
 class SoundManager:
     """
     This object handle any music or soundeffect of our game
+
+    A music is made of a header, a loop and a queue. The segment following
+    the one playing is always queued in the mixer, which chains them without
+    gap and posts an event when it starts the queued one. Files of a music
+    are read by a worker as soon as it is asked
+
+    Sound effects play on channels reserved for their group. A full group
+    steals its least important voice, and each sound has a cap on the
+    voices it plays at once. Buffers are decoded by a worker and cached
+    within a budget, a buffer stays resident while it plays
     """
     def __init__(self: Self) -> None:
         self.current_music: dict[str, str]  = {}
         self.next_music: dict[str, str] = {}
         self.music_phase: str = ""
+        self.queued_phase: str = ""
+        self.queued_path: str = ""
         self.ask_music_end: bool = False
-        self.sfx: dict[str, Sound] = {}
+        self.fading: bool = False
+        self.fade_ms: int = 0
+        self.reader: ThreadPoolExecutor = ThreadPoolExecutor(1, "music")
+        self.music_files: dict[str, Future[bytes]] = {}
+        self.sfx: dict[str, Sfx] = {}
+        self.buffers: ResourceManager = ResourceManager(cts.sfx_budget)
+        self.decoder: ThreadPoolExecutor = ThreadPoolExecutor(1, "sfx")
+        self.decoding: dict[str, Future[Sound]] = {}
+        self.pending: list[tuple[str, int | None, int]] = []
+        self.channels: list[Channel] = []
+        self.groups: dict[str, range] = {}
+        self.voices: dict[int, tuple[str, int, int, str]] = {}
+        self.voice_count: int = 0
+        set_endevent(EVENTS.music_end)
+        
+        # Every channel belongs to a group, so pygame never picks one by itself
+        if get_init():
+            set_num_channels(sum(cts.channel_groups.values()))
+            set_reserved(sum(cts.channel_groups.values()))
+            for group, size in cts.channel_groups.items():
+                self.groups[group] = range(len(self.channels), len(self.channels) + size)
+                self.channels += [Channel(i) for i in self.groups[group]]
 
-    def play_music(self: Self, music: dict[str, str]) -> None:
+    def play_music(self: Self, music: dict[str, str], fade_ms: int=0) -> None:
+        # The current music ends after its queue, or fades out then the new one fades in
+        for path in music.values():
+            if path and path not in self.music_files:
+                self.music_files[path] = self.reader.submit(read_file, path)
         self.next_music = music
         self.ask_music_end = True
+        self.fade_ms = fade_ms
+        if fade_ms and self.music_phase:
+            # The mixer drops the queued segment, the end of the fade is posted like the end of a music
+            fadeout(fade_ms)
+            self.queued_phase, self.queued_path = "", ""
+            self.fading = True
+        else:
+            self.queue_segment()
 
-    def switch_to_next_music(self: Self) -> None:
+    def is_ready(self: Self, path: str) -> bool:
+        return path in self.music_files and self.music_files[path].done()
+
+    def get_music_file(self: Self, path: str) -> BytesIO:
+        # Each segment gets its own stream over the data read by the worker
+        return BytesIO(self.music_files[path].result())
+
+    def get_next_segment(self: Self) -> tuple[str, str]:
+        # Phase and file of the segment which follows the playing one, the next music comes after the queue
+        if self.music_phase == "header" or (self.music_phase == "loop" and not self.ask_music_end):
+            return "loop", self.current_music["loop"]
+        if self.music_phase == "loop" and self.current_music["queue"]:
+            return "queue", self.current_music["queue"]
         if self.next_music:
-            self.current_music = self.next_music
-            self.next_music = {}
-            self.play_header()
-
-    def play_header(self: Self) -> None:
-        if self.current_music["header"]:
-            load(self.current_music["header"])
-            play()
-            self.music_phase = "header"
-        else:
-            self.play_loop()
-
-    def play_loop(self: Self) -> None:
-        load(self.current_music["loop"])
-        play()
-        self.music_phase = "loop"
-
-    def play_queue(self: Self) -> None:
-        if self.current_music["queue"]:
-            load(self.current_music["queue"])
-            play(fade_ms=1000)
-            self.music_phase = "queue"
-        else:
+            return "next", self.next_music["header"] or self.next_music["loop"]
+        return "", ""
+
+    def queue_segment(self: Self) -> None:
+        if not self.music_phase or self.fading:
+            return
+        phase, path = self.get_next_segment()
+        # A segment is only queued once read, until then the mixer keeps the one queued before
+        if phase and (phase, path) != (self.queued_phase, self.queued_path) and self.is_ready(path):
+            queue(self.get_music_file(path), splitext(path)[1][1:])
+            self.queued_phase, self.queued_path = phase, path
+
+    def switch_to_next_music(self: Self) -> None:
+        self.current_music = self.next_music
+        self.next_music = {}
+        self.ask_music_end = False
+        self.music_phase = "header" if self.current_music["header"] else "loop"
+        # Files of the previous music are no longer needed
+        self.music_files = {path: file for path, file in self.music_files.items() if path in self.current_music.values()}
+
+    def start_music(self: Self) -> None:
+        self.switch_to_next_music()
+        path = self.current_music[self.music_phase]
+        load(self.get_music_file(path), splitext(path)[1][1:])
+        play(fade_ms=self.fade_ms)
+        self.fade_ms = 0
+        self.queue_segment()
+
+    def next_segment(self: Self) -> None:
+        # The mixer started the queued segment, or ended the music when nothing was queued
+        phase, self.queued_phase, self.queued_path = self.queued_phase, "", ""
+        self.fading = False
+        if phase == "next":
             self.switch_to_next_music()
+        else:
+            self.music_phase = phase
+            if phase == "loop" and self.ask_music_end and not self.get_next_segment()[0]:
+                # This loop was queued before the end was asked and nothing follows it, the mixer cannot unqueue it so we stop it
+                stop()
+                return
+        self.queue_segment()
 
     def update(self: Self) -> None:
-        if not get_busy():
-            if self.current_music:
-                if self.music_phase == "header":
-                    self.play_loop()
-                elif self.music_phase == "loop":
-                    if self.ask_music_end:
-                        self.play_queue()
-                        self.ask_music_end = False
-                    else:
-                        self.play_loop()
-                elif self.music_phase == "queue":
-                    self.switch_to_next_music()
-            else:
-                self.switch_to_next_music()
-
-    def load_sfx(self: Self, name: str, file_path: str) -> None:
-        self.sfx[name] = Sound(file_path)
-
-    def play_sfx(self: Self, name: str) -> None:
-        if name in self.sfx:
-            self.sfx[name].play()
+        # Segments are chained by the mixer, we only start musics and queue segments which were read late
+        if not self.music_phase:
+            if self.next_music and self.is_ready(self.next_music["header"] or self.next_music["loop"]):
+                self.start_music()
+        else:
+            self.queue_segment()
+        self.update_sfx()
+
+    def load_sfx(self: Self, name: str, file_path: str, group: str=cts.default_group, priority: int=0, max_instances: int=cts.max_instances) -> None:
+        if group not in cts.channel_groups:
+            raise ValueError(f"Unknown channel group {group} for sound {name}, expected one of {list(cts.channel_groups)}")
+        # Decoding happens later in a worker, so a wrong path is reported here
+        if not exists(file_path):
+            raise FileNotFoundError(f"No sound file {file_path} for sound {name}")
+        self.sfx[name] = Sfx(file_path, group, priority, max_instances)
+        self.decode_sfx(file_path)
+
+    def unload_sfx(self: Self, name: str) -> None:
+        # The buffer stays cached until the budget needs its memory
+        self.sfx.pop(name, None)
+
+    def decode_sfx(self: Self, path: str) -> None:
+        if path not in self.buffers and path not in self.decoding:
+            self.decoding[path] = self.decoder.submit(Sound, path)
+
+    def play_sfx(self: Self, name: str, priority: int | None=None) -> None:
+        if name not in self.sfx:
+            return
+        if self.sfx[name].path in self.buffers:
+            self.start_voice(name, priority)
+        else:
+            # Sounds which are not decoded yet play once they are, if they are not too late
+            self.decode_sfx(self.sfx[name].path)
+            self.pending.append((name, priority, get_ticks()))
+
+    def get_channel(self: Self, name: str, priority: int) -> int | None:
+        # Voices of a sound are limited, its oldest one is replaced
+        sfx = self.sfx[name]
+        instances = [channel for channel, voice in self.voices.items() if voice[0] == name]
+        if len(instances) >= sfx.max_instances:
+            return min(instances, key=lambda channel: self.voices[channel][2])
+        
+        # Groups have no channel when the mixer could not be initialized
+        group = self.groups.get(sfx.group, range(0))
+        free = next((channel for channel in group if channel not in self.voices or not self.channels[channel].get_busy()), None)
+        if free is not None or not group:
+            return free
+        
+        # A full group steals its least important voice, the oldest among equals, unless the new one matters less
+        channel = min(group, key=lambda channel: self.voices[channel][1:3])
+        return channel if self.voices[channel][1] <= priority else None
+
+    def start_voice(self: Self, name: str, priority: int | None=None) -> None:
+        sfx = self.sfx[name]
+        priority = sfx.priority if priority is None else priority
+        channel = self.get_channel(name, priority)
+        if channel is None:
+            return
+        # The buffer is acquired before the stolen voice gives its own back, so it cannot be evicted in between
+        sound = self.buffers.acquire(sfx.path, lambda: Sound(sfx.path))
+        self.stop_voice(channel)
+        self.channels[channel].play(sound)
+        self.voices[channel] = (name, priority, self.voice_count, sfx.path)
+        self.voice_count += 1
+
+    def stop_voice(self: Self, channel: int) -> None:
+        if channel in self.voices:
+            self.channels[channel].stop()
+            self.buffers.release(self.voices.pop(channel)[3])
+
+    def update_sfx(self: Self) -> None:
+        # Finished voices give their buffer back
+        for channel in [channel for channel in self.voices if not self.channels[channel].get_busy()]:
+            self.stop_voice(channel)
+        
+        # Decoded buffers are cached without being used, so the budget can evict them
+        for path in [path for path, future in self.decoding.items() if future.done()]:
+            # A file which cannot be decoded raises here, like it would have raised when loaded
+            future = self.decoding.pop(path)
+            self.buffers.acquire(path, future.result)
+            self.buffers.release(path)
+        
+        now = get_ticks()
+        pending, self.pending = self.pending, []
+        for name, priority, asked in pending:
+            if name not in self.sfx:
+                continue
+            if self.sfx[name].path in self.buffers:
+                if now - asked <= cts.max_latency:
+                    self.start_voice(name, priority)
+            elif self.sfx[name].path in self.decoding:
+                self.pending.append((name, priority, asked))
 
     def set_music_volume(self: Self, volume: int) -> None:
         set_volume(volume)
 
-    def set_sfx_volume(self: Self, volume: int) -> None:
-        for name in self.sfx.keys():
-            self.sfx[name].set_volume(volume)
+    def set_sfx_volume(self: Self, volume: int, group: str | None=None) -> None:
+        # Volumes are set on channels, so they apply to every sound played on them
+        for channel in self.groups[group] if group is not None else range(len(self.channels)):
+            self.channels[channel].set_volume(volume)
 
     def stop_music(self: Self) -> None:
         self.ask_music_end = True
@@ -0,0 +1,51 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self
+from collections import OrderedDict
+from pygame import Surface
+from pygame.font import SysFont as font, Font
+
+# Import game components
+from .constants import TEXT as cts
+
+
+# Create the TextCache object
+class TextCache:
+    """
+    This object shares fonts and rendered texts
+
+    Fonts are kept by name and size, rendered texts by their text, font,
+    color and antialiasing. Only the last used texts are kept, so static
+    texts of menus and HUDs are rasterized once
+    """
+    def __init__(self: Self, capacity: int=cts.capacity) -> None:
+        self.capacity: int = capacity
+        self.fonts: dict[tuple[str | None, int], Font] = {}
+        self.texts: OrderedDict[tuple[str, str | None, int, tuple[int, ...], bool], Surface] = OrderedDict()
+
+    def get_font(self: Self, size: int, name: str | None=None) -> Font:
+        key = (name, size)
+        if key not in self.fonts:
+            self.fonts[key] = font(name, size)
+        return self.fonts[key]
+
+    def render(self: Self, text: str, size: int, color: tuple[int, ...], antialias: bool=True, name: str | None=None) -> Surface:
+        # The returned surface is shared, it must not be drawn on
+        key = (text, name, size, tuple(color), antialias)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.get_font(size, name).render(text, antialias, color)
+            self.texts[key] = surface
+            if len(self.texts) > self.capacity:
+                self.texts.popitem(last=False)
+        else:
+            self.texts.move_to_end(key)
+        return surface
+
+    def clear(self: Self) -> None:
+        self.fonts.clear()
+        self.texts.clear()
+
+
+text_cache: TextCache = TextCache()
@@ -0,0 +1,75 @@
+#-*-coding:utf-8-*-
+
+# Import built-in modules
+from typing import Self, Callable
+from heapq import heappush, heappop
+
+
+# Create the Timer object
+class Timer:
+    """
+    Handle of a timer given by the scheduler, it can be cancelled at any time
+    """
+    def __init__(self: Self, name: str, due: int, duration: int, repeat: bool, callback: Callable[[], None] | None) -> None:
+        self.name: str = name
+        self.due: int = due
+        self.duration: int = duration
+        self.repeat: bool = repeat
+        self.callback: Callable[[], None] | None = callback
+        self.active: bool = True
+
+    def cancel(self: Self) -> None:
+        self.active = False
+
+
+# Create the Scheduler object
+class Scheduler:
+    """
+    This object keeps timers in a min-heap ordered by due time
+
+    Updating only looks at expired timers, cancelled ones are dropped when
+    they reach the top of the heap
+    """
+    def __init__(self: Self, get_ticks: Callable[[], int]) -> None:
+        self.get_ticks: Callable[[], int] = get_ticks
+        self.heap: list[tuple[int, int, Timer]] = []
+        self.count: int = 0
+
+    def __len__(self: Self) -> int:
+        return len(self.heap)
+
+    def push(self: Self, timer: Timer) -> None:
+        # The counter keeps timers due at the same time in their scheduling order
+        heappush(self.heap, (timer.due, self.count, timer))
+        self.count += 1
+
+    def schedule(self: Self, duration: int, repeat: bool=False, callback: Callable[[], None] | None=None, name: str="") -> Timer:
+        timer = Timer(name, self.get_ticks() + duration, max(1, duration), repeat, callback)
+        self.push(timer)
+        return timer
+
+    def update(self: Self) -> list[Timer]:
+        now = self.get_ticks()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            timer = heappop(self.heap)[2]
+            if not timer.active:
+                continue
+            expired.append(timer)
+            if timer.repeat:
+                # Repeating timers stay on their own beat, missed periods are skipped instead of run late
+                timer.due += ((now - timer.due) // timer.duration + 1) * timer.duration
+                self.push(timer)
+            else:
+                timer.active = False
+
+        # Callbacks run once the heap is in order, so they can schedule or cancel timers
+        for timer in expired:
+            if timer.callback is not None:
+                timer.callback()
+        return expired
+
+    def clear(self: Self) -> None:
+        for _, _, timer in self.heap:
+            timer.active = False
+        self.heap = []
@@ -1,86 +1,112 @@
 #-*-coding: utf-8-*-
 
 # Import built-in modules
-from typing import Self
-from pygame.display import flip
-from pygame.time import get_ticks
-from pygame import Surface, SRCALPHA, quit
+from typing import Self, Any, Callable
+from pygame import Surface
 
 # Import game components
 from .constants import TRANSITION as cts
 
 
+# Surfaces of transitions are created once and shared by all of them
+buffers: dict[str, Surface] = {}
+
+
+# Create helper functions of the module
+def get_buffer(name: str, size: tuple[int, int]) -> Surface:
+    buffer = buffers.get(name)
+    if buffer is None or buffer.get_size() != size:
+        buffer = Surface(size).convert()
+        buffers[name] = buffer
+    return buffer
+
+
 # Create Base objects for all transitions
 class Transition:
     """
     This object is the base objects of all transitions
-    
-    It does nothing as transition its only a structure object
+
+    Transitions are state machines advanced by the game loop, one fixed
+    step per update, and drawn from a snapshot of the scene taken when
+    they start. The base transition ends at once and draws nothing
     """
-    def __init__(self: Self) -> None:
-        pass
-    
-    def play(self, scene) -> None:
-        pass
-    
+    def __init__(self: Self, duration: int=0) -> None:
+        self.duration: int = duration
+        self.time: float = 0
+        self.done: bool = False
+        self.on_done: Callable[[], None] | None = None
+        self.snapshot: Surface | None = None
+        self.ramp: list[int] = []
+        self.level: int = -1
 
-# Create Fade-out transition
-class FadeOut(Transition):
+    def start(self: Self, scene: Any, on_done: Callable[[], None] | None=None) -> None:
+        # The scene is rendered once on the screen and kept as it is for the whole transition
+        screen = scene.game_engine.screen
+        scene.render()
+        self.snapshot = get_buffer("snapshot", screen.get_size())
+        self.snapshot.blit(screen, (0, 0))
+        self.on_done = on_done
+        self.time = 0
+        self.done = self.duration <= 0
+        self.level = -1
+
+    def update(self: Self, step: float) -> None:
+        self.time += step
+        if self.time >= self.duration:
+            self.done = True
+
+    def get_level(self: Self) -> int:
+        # Index of the ramp entry for the current time
+        if not self.ramp:
+            return 0
+        return min(len(self.ramp) - 1, int(self.time / max(1, self.duration) * (len(self.ramp) - 1)))
+
+    def changed(self: Self) -> bool:
+        return self.get_level() != self.level
+
+    def draw(self: Self, screen: Surface) -> None:
+        self.level = self.get_level()
+
+
+# Create Fade transitions
+class Fade(Transition):
     """
-    FadeOut transition
+    Fade between the snapshot and a plain color
+
+    Alpha values of each step are computed once, then the same overlay
+    surface is blitted over the snapshot with the alpha of the step
     """
-    def __init__(self: Self, duration: int) -> None:
-        Transition.__init__(self)
-        self.duration: int = duration
-        
-    def play(self, scene) -> None:
-        clock = scene.game_engine.clock
-        start_time = get_ticks()
-        alpha = 0
+    def __init__(self: Self, duration: int, start: int, end: int) -> None:
+        Transition.__init__(self, duration)
+        steps = max(1, round(duration * cts.update_fps / 1000))
+        self.ramp = [round(start + (end - start) * i / steps) for i in range(steps + 1)]
+        self.overlay: Surface | None = None
         
-        while alpha < 255:
-            scene.game_engine.event_manager.handle_events()
-            if scene.game_engine.event_manager.get_event("Quit"):
-                quit()
-                exit()
+    def start(self: Self, scene: Any, on_done: Callable[[], None] | None=None) -> None:
+        Transition.start(self, scene, on_done)
+        self.overlay = get_buffer("overlay", scene.game_engine.screen.get_size())
+        self.overlay.fill(cts.color)
 
-            elapsed = get_ticks() - start_time
-            alpha = int(min(255, (elapsed / self.duration) * 255))
+    def draw(self: Self, screen: Surface) -> None:
+        Transition.draw(self, screen)
+        self.overlay.set_alpha(self.ramp[self.level]) # type: ignore
+        screen.blit(self.snapshot, (0, 0)) # type: ignore
+        screen.blit(self.overlay, (0, 0)) # type: ignore
 
-            scene.render()
-            fade_surface = Surface(scene.game_engine.screen.get_size(), SRCALPHA)
-            fade_surface.fill((0, 0, 0, alpha))
-            scene.game_engine.screen.blit(fade_surface, (0, 0))
-            flip()
-            clock.tick(cts.max_fps)
+
+# Create Fade-out transition
+class FadeOut(Fade):
+    """
+    FadeOut transition
+    """
+    def __init__(self: Self, duration: int) -> None:
+        Fade.__init__(self, duration, 0, 255)
 
 
 # Create Fade-in transition
-class FadeIn(Transition):
+class FadeIn(Fade):
     """
     FadeIn transition
     """
     def __init__(self: Self, duration: int) -> None:
-        Transition.__init__(self)
-        self.duration: int = duration
-        
-    def play(self, scene) -> None:
-        clock = scene.game_engine.clock
-        start_time = get_ticks()
-        alpha = 255
-        
-        while alpha > 0:
-            scene.game_engine.event_manager.handle_events()
-            if scene.game_engine.event_manager.get_event("Quit"):
-                quit()
-                exit()
-            
-            elapsed = get_ticks() - start_time
-            alpha = int(max(0, (1 - elapsed / self.duration) * 255))
-
-            scene.render()
-            fade_surface = Surface(scene.game_engine.screen.get_size(), SRCALPHA)
-            fade_surface.fill((0, 0, 0, alpha))
-            scene.game_engine.screen.blit(fade_surface, (0, 0))
-            flip()
-            clock.tick(cts.max_fps)
\ No newline at end of file
+        Fade.__init__(self, duration, 255, 0)
@@ -2,6 +2,7 @@
 
 # import built-in modules
 import pygame.locals as pgcts
+from pygame.event import custom_type
 from os.path import join
 
 # Create constants
@@ -9,6 +10,10 @@ class SCREEN:
     size: tuple[int, int]=(20*48, 11*48)
     flags: int = pgcts.FULLSCREEN | pgcts.SCALED
     max_fps: int = 60
+    update_fps: int = 60
+    max_steps: int = 5
+    max_frame_skip: int = 2
+    preload_scenes: bool = True
     
 class SCENE(SCREEN):
     flags: int = pgcts.SRCALPHA
@@ -21,12 +26,49 @@ class EVENTS:
     default_move_down: list[int] = [pgcts.K_s, pgcts.K_DOWN]
     default_move_left: list[int] = [pgcts.K_q, pgcts.K_LEFT]
     default_move_right: list[int] = [pgcts.K_d, pgcts.K_RIGHT]
-    default_events: list[str] = ["Action", "Cancel", "MoveUp", "MoveDown", "MoveLeft", "MoveRight", "Quit", "Pressed", "Release"]
+    repeat_delay: int = 15
+    repeat_interval: int = 15
+    music_end: int = custom_type()
+    default_events: list[str] = ["Action", "Cancel", "MoveUp", "MoveDown", "MoveLeft", "MoveRight", "Quit", "Pressed", "Release", "Profiler", "ProfilerTrace", "MusicEnd"]
 
 class MAP(SCENE):
     map_folder: str = join("Data", "Maps")
+    binary_extension: str = ".rmap"
     tileset_folder: str = join("Data", "Tilesets")
     tileset_graphics_folder: str = join("Assets", "Graphics", "Tilesets")
+    tileset_cache_folder: str = join("Data", "Cache", "Tilesets")
+    atlas_columns: int = 32
+    chunk_size: int = 16
+    actor_layer: int = 0
+    max_redraw: int = 64
+    stream_radius: int = 1
+    stream_cache: int = 16
+    prefetch_workers: int = 2
     
-class TRANSITION:
-    max_fps: int = 60
\ No newline at end of file
+class PROFILER(SCENE):
+    capacity: int = 600
+    budget: float = 1000/SCENE.max_fps
+    idle_phases: list[str] = ["tick"]
+    trace_folder: str = join("Data", "Cache", "Traces")
+    overlay_position: tuple[int, int] = (4, 4)
+    overlay_refresh: int = 30
+    font_size: int = 18
+    
+class RESOURCE:
+    budget: int = 128*1024*1024
+    
+class SOUND:
+    channel_groups: dict[str, int] = {"ui": 2, "voice": 2, "world": 12}
+    default_group: str = "world"
+    max_instances: int = 4
+    sfx_budget: int = 32*1024*1024
+    max_latency: int = 100
+    
+class TEXT:
+    capacity: int = 256
+    
+class TRANSITION(SCREEN):
+    color: tuple[int, int, int] = (0, 0, 0)
+    
+class CAMERA(SCREEN):
+    speed: int = 4
@@ -4,7 +4,9 @@ import tkinter as tk
 from tkinter import Canvas, filedialog
 from tkinter.messagebox import askyesno
 from PIL import Image, ImageTk
-from libs.Map import Map, Tile
+from libs.Map import Map, Tile, animation_clock
+from libs.Camera import Camera
+from libs.Text import text_cache
 from typing import Optional
 import json
 
@@ -63,7 +65,7 @@ def update_tile_picker():
     canvas.config(width=picker_width, height=picker_height)
 
     for i, tile in enumerate(tileset.tiles):
-        pygame_surface = tile.get_tile([0] * 8)
+        pygame_surface = tile.get_tile(0)
         image = pygame.surfarray.array3d(pygame_surface)
         image = Image.fromarray(image.swapaxes(0, 1))
         tk_image = ImageTk.PhotoImage(image)
@@ -99,9 +101,9 @@ def handle_tile_placement(mouse_pos, is_removal=False):
     x, y = get_tile_pos(mouse_pos)
     if 0 <= x < my_map.size[0] and 0 <= y < my_map.size[1]:
         if is_removal:
-            my_map.tilemap[current_layer_id][y][x] = None
+            my_map.set_tile(current_layer_id, x, y, None)
         else:
-            my_map.tilemap[current_layer_id][y][x] = selected_tile
+            my_map.set_tile(current_layer_id, x, y, selected_tile)
 
 def handle_mouse_drag():
     """Handles tile placement while dragging the mouse."""
@@ -136,24 +138,27 @@ def handle_drag(event):
                         
 def draw_map():
     global current_layer_id, my_map
-    # Get the rendered layers dictionary from map_obj
-    layers = my_map.render_layers((0, 0))
+    # Get the rendered layers dictionary from map_obj, seen from the scrolled viewport
+    camera = Camera(my_map.get_pixel_size(), (viewport_width, viewport_height))
+    camera.move_to(scroll_x, scroll_y)
+    layers = my_map.render_layers(camera)
     
     for layer_id, surface in layers.items():
         # If it's the focused layer, render normally
         if layer_id < current_layer_id:
-            # Apply a black alpha filter to non-focused layers
+            # Apply a black alpha filter over non-focused layers
             filtered_surface = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
             filtered_surface.fill((0, 0, 0, 128))  # Transparent black filter
 
-            # Apply the filter to the tile graphics
-            surface.blit(filtered_surface, (0, 0))
-            screen.blit(surface, (-scroll_x, -scroll_y))
+            # Layer surfaces are kept by the map between frames, so the filter goes on the screen
+            screen.blit(surface, (0, 0))
+            screen.blit(filtered_surface, (0, 0))
         elif layer_id == current_layer_id:
-            screen.blit(surface, (-scroll_x, -scroll_y))
+            screen.blit(surface, (0, 0))
         else:
             surface.set_alpha(128)
-            screen.blit(surface, (-scroll_x, -scroll_y))
+            screen.blit(surface, (0, 0))
+            surface.set_alpha(None)
 
 # Function to create a new map
 def create_new_map():
@@ -176,6 +181,7 @@ def create_new_map():
     }
     with open(f"Data\\Maps\\{name}.json", 'w') as file:
         json.dump(map_data, file, indent=4)  # Save the map data to the JSON file
+    my_map.unload()
     my_map = Map(name)
     current_layer_id = 0  # Start with the first layer
     print(f"New map created: {width}x{height}, {num_layers} layers.")
@@ -186,6 +192,7 @@ def load_map():
     file_path = filedialog.askopenfilename(defaultextension=".json", filetypes=[("Map Files", "*.json")])
     
     if file_path:
+        my_map.unload()
         my_map = Map(file_path[:-5])
 
 # Function to save the current map to file
@@ -193,37 +200,19 @@ def save_map():
     file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Map Files", "*.json")])
     
     if file_path:
-        map_data = {
-            "name": my_map.name,
-            "size": my_map.size,
-            "bgm": "",
-            "bgs": "",
-            "layer_id_range": my_map.layer_id_range,
-            "tileset": my_map.tileset.name,
-            "layers": []
-        }
-
-        # Prepare layers data
-        for layer_id, tiles in my_map.tilemap.items():
-            layer_data = {
-                "id": layer_id,
-                "tiles": [[tile.tile_id if tile else -1 for tile in row] for row in tiles]
-            }
-            map_data["layers"].append(layer_data)
-
-        with open(file_path, 'w') as file:
-            json.dump(map_data, file)  # Save the map data to the JSON file
-            print(f"Map saved to {file_path}")
+        my_map.save_json(file_path)
+        print(f"Map saved to {file_path}")
 
 def draw_layer_info():
     """Displays the current active layer at the top of the screen."""
-    font = pygame.font.Font(None, 24)
-    text = font.render(f"Current Layer: {current_layer_id}", True, (255, 255, 255))
+    text = text_cache.render(f"Current Layer: {current_layer_id}", 24, (255, 255, 255))
     screen.blit(text, (10, 10))  # Position near tile panel
 
 # === Main Loop ===
+clock = pygame.time.Clock()
 running = True
 while running:
+    animation_clock.tick(clock.tick())
     screen.fill((255, 255, 255))
     draw_map()
     draw_layer_info()
@@ -251,8 +240,7 @@ while running:
                     answer = askyesno("new layer", f"Do you want to create a new layer above layer {current_layer_id} ?")
                     if answer:
                         current_layer_id += 1
-                        my_map.layer_id_range[-1] += 1
-                        my_map.tilemap[current_layer_id] = [[None for _ in range(my_map.size[0])] for _ in range(my_map.size[1])]
+                        my_map.add_layer(current_layer_id)
             elif event.key == K_DOWN:  # Move down to the previous layer within valid range
                 if current_layer_id > my_map.layer_id_range[0]:
                     current_layer_id -= 1
@@ -260,8 +248,7 @@ while running:
                     answer = askyesno("new layer", f"Do you want to create a new layer under layer {current_layer_id} ?")
                     if answer:
                         current_layer_id -= 1
-                        my_map.layer_id_range[0] -= 1
-                        my_map.tilemap[current_layer_id] = [[None]*my_map.size[0]]*my_map.size[1]
+                        my_map.add_layer(current_layer_id)
             elif event.key == K_n:
                 create_new_map()
             elif event.key == K_o: